@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from typing import List
 from app.core.database import get_db
-from app.core.security import RoleChecker, decode_access_token
+from app.core.security import RoleChecker
 from app.models.user import UserRole
 from app.models.assignment import Assignment, AssignmentType
 from app.models.submission import Submission
+from app.services.assignment_stats import get_single_assignment_stats
+from app.services.user_stats import bump_user_stats, unbump_submissions
 from app.schemas.assignment import (
     AssignmentCreate,
     AssignmentUpdate,
@@ -26,9 +28,8 @@ student_checker = RoleChecker([UserRole.STUDENT])
 async def create_assignment(
     assignment: AssignmentCreate,
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(teacher_checker)
+    token: dict = Depends(teacher_checker)
 ):
-    payload = decode_access_token(token)
     db_assignment = Assignment(
         title=assignment.title,
         content=assignment.content,
@@ -37,7 +38,7 @@ async def create_assignment(
         correct_answer=assignment.correct_answer,
         points=assignment.points,
         due_date=assignment.due_date,
-        created_by=payload.get("user_id")
+        created_by=token.get("user_id")
     )
     db.add(db_assignment)
     await db.commit()
@@ -135,6 +136,8 @@ async def delete_assignment(
             detail="Assignment not found"
         )
     
+    # 提交会随作业级联删除，先把它们从 user_stats 里减掉
+    await unbump_submissions(db, Submission.assignment_id == assignment_id)
     await db.delete(db_assignment)
     await db.commit()
     return {"message": "Assignment deleted successfully"}
@@ -145,10 +148,8 @@ async def submit_assignment(
     assignment_id: int,
     submission: SubmissionCreate,
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(student_checker)
+    token: dict = Depends(student_checker)
 ):
-    payload = decode_access_token(token)
-    
     result = await db.execute(select(Assignment).where(Assignment.id == assignment_id))
     assignment = result.scalar_one_or_none()
     if assignment is None:
@@ -158,7 +159,7 @@ async def submit_assignment(
         )
     
     db_submission = Submission(
-        user_id=payload.get("user_id"),
+        user_id=token.get("user_id"),
         assignment_id=assignment_id,
         student_answer=submission.student_answer
     )
@@ -170,6 +171,12 @@ async def submit_assignment(
         db_submission.graded = 1
     
     db.add(db_submission)
+    await bump_user_stats(
+        db,
+        db_submission.user_id,
+        total_submissions=1,
+        correct_count=1 if db_submission.is_correct == 1 else 0
+    )
     await db.commit()
     await db.refresh(db_submission)
     return db_submission
@@ -196,30 +203,11 @@ async def get_quiz_result(
     db: AsyncSession = Depends(get_db),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(Submission.assignment_id == assignment_id)
-    )
-    total_submissions = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(
-            Submission.assignment_id == assignment_id,
-            Submission.is_correct == 1
-        )
-    )
-    correct_count = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.avg(Submission.score))
-        .where(Submission.assignment_id == assignment_id)
-    )
-    avg_score = result.scalar() or 0.0
+    stats = await get_single_assignment_stats(db, assignment_id)
     
     return QuizResult(
         assignment_id=assignment_id,
-        total_submissions=total_submissions,
-        correct_count=correct_count,
-        avg_score=float(avg_score)
+        total_submissions=stats.total_submissions if stats else 0,
+        correct_count=stats.correct_count if stats else 0,
+        avg_score=stats.avg_score if stats else 0.0
     )
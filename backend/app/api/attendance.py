@@ -4,10 +4,13 @@ from sqlalchemy import select, func
 from typing import List
 from datetime import datetime, timedelta
 import uuid
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.security import RoleChecker, decode_access_token
+from app.core.security import RoleChecker, get_current_user
 from app.models.user import UserRole
 from app.models.attendance import Attendance
+from app.services.presence import PresenceService
+from app.services.user_stats import bump_user_stats
 from app.schemas.attendance import (
     AttendanceResponse,
     SigninRequest,
@@ -21,6 +24,16 @@ teacher_checker = RoleChecker([UserRole.ADMIN, UserRole.TEACHER])
 
 active_signins = {}
 
+# 签到、心跳刷新在线状态；在线人数和列表只读内存
+online_presence = PresenceService(settings.ONLINE_TIMEOUT_SECONDS)
+
+
+def touch_presence(token: dict):
+    online_presence.touch(token.get("user_id"), {
+        "username": token.get("sub"),
+        "role": token.get("role")
+    })
+
 
 @router.post("/signin", response_model=SigninResponse)
 async def start_signin(
@@ -48,7 +61,7 @@ async def start_signin(
 async def sign_in(
     signin_id: str,
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(decode_access_token)
+    token: dict = Depends(get_current_user)
 ):
     if signin_id not in active_signins:
         raise HTTPException(
@@ -76,6 +89,7 @@ async def sign_in(
     if last_attendance and last_attendance.logout_time is None:
         last_attendance.logout_time = now
         last_attendance.session_duration = int((now - last_attendance.login_time).total_seconds())
+        await bump_user_stats(db, user_id, total_duration=last_attendance.session_duration)
         await db.commit()
     
     is_late = 1 if (signin["expires_at"] - now).total_seconds() < (signin["duration_minutes"] * 60 * 0.8) else 0
@@ -87,7 +101,15 @@ async def sign_in(
         is_late=is_late
     )
     db.add(attendance)
+    await bump_user_stats(
+        db,
+        user_id,
+        total_sessions=1,
+        activity_sum=attendance.activity_score,
+        late_count=is_late
+    )
     await db.commit()
+    touch_presence(token)
     
     return {"message": "Signed in successfully"}
 
@@ -130,7 +152,7 @@ async def get_signin_records(
 @router.post("/logout")
 async def logout(
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(decode_access_token)
+    token: dict = Depends(get_current_user)
 ):
     user_id = token.get("user_id")
     now = datetime.utcnow()
@@ -145,11 +167,25 @@ async def logout(
     if attendance and attendance.logout_time is None:
         attendance.logout_time = now
         attendance.session_duration = int((now - attendance.login_time).total_seconds())
+        await bump_user_stats(db, user_id, total_duration=attendance.session_duration)
         await db.commit()
     
+    online_presence.remove(user_id)
     return {"message": "Logged out successfully"}
 
 
+@router.post("/heartbeat")
+async def heartbeat(token: dict = Depends(get_current_user)):
+    touch_presence(token)
+    return {"online_count": online_presence.count()}
+
+
+@router.get("/online")
+async def get_online_users(token: dict = Depends(teacher_checker)):
+    online = online_presence.online()
+    return {"online": online, "count": len(online)}
+
+
 @router.get("/records", response_model=List[AttendanceResponse])
 async def get_attendance_records(
     user_id: int = None,
@@ -170,7 +206,7 @@ async def get_attendance_records(
 @router.get("/my-records", response_model=List[AttendanceResponse])
 async def get_my_attendance_records(
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(decode_access_token)
+    token: dict = Depends(get_current_user)
 ):
     user_id = token.get("user_id")
     query = select(Attendance).where(Attendance.user_id == user_id)
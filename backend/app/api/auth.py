@@ -5,8 +5,8 @@ from sqlalchemy import select
 from datetime import timedelta
 from app.core.database import get_db
 from app.core.security import (
-    verify_password,
-    get_password_hash,
+    verify_and_update_password_async,
+    get_password_hash_async,
     create_access_token,
     decode_access_token
 )
@@ -30,7 +30,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
         username=user.username,
         full_name=user.full_name,
         role=user.role,
-        password_hash=get_password_hash(user.password),
+        password_hash=await get_password_hash_async(user.password),
         avatar=user.avatar
     )
     db.add(db_user)
@@ -44,12 +44,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     result = await db.execute(select(User).where(User.username == form_data.username))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    verified, new_hash = await verify_and_update_password_async(form_data.password, user.password_hash)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password"
+        )
+    
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+    
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "user_id": user.id, "role": user.role.value},
@@ -3,11 +3,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from datetime import datetime
-from app.core.database import get_db
-from app.core.security import RoleChecker, decode_access_token
+from app.core.database import get_db, get_read_db
+from app.core.security import RoleChecker, get_current_user
 from app.models.user import UserRole
-from app.models.board import BoardLog, BoardMessage
+from app.models.board import BoardMessage
 from app.schemas.attendance import BoardDraw, BoardMessage as BoardMessageSchema
+from app.services.board_log import board_log
 from app.websocket import manager
 
 router = APIRouter()
@@ -18,14 +19,13 @@ teacher_checker = RoleChecker([UserRole.ADMIN, UserRole.TEACHER])
 @router.post("/draw")
 async def draw_on_board(
     draw_data: BoardDraw,
-    db: AsyncSession = Depends(get_db),
-    token: str = Depends(decode_access_token)
+    token: dict = Depends(get_current_user)
 ):
-    payload = decode_access_token(token)
-    
-    board_log = BoardLog(
-        board_id=draw_data.board_id,
-        content={
+    # 进事件日志缓冲区，按批提交，不再每笔一次 commit
+    seq = await board_log.append(
+        draw_data.board_id,
+        draw_data.action,
+        {
             "action": draw_data.action,
             "x": draw_data.x,
             "y": draw_data.y,
@@ -33,15 +33,12 @@ async def draw_on_board(
             "size": draw_data.size,
             "points": draw_data.points
         },
-        action_type=draw_data.action,
-        created_by=payload.get("user_id")
+        token.get("user_id")
     )
-    db.add(board_log)
-    await db.commit()
     
     await manager.broadcast_to_board(draw_data.board_id, {
         "type": "draw",
-        "data": draw_data.dict()
+        "data": {**draw_data.dict(), "seq": seq}
     })
     
     return {"status": "success"}
@@ -51,10 +48,13 @@ async def draw_on_board(
 async def clear_board(
     board_id: str,
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(teacher_checker)
+    token: dict = Depends(teacher_checker)
 ):
+    seq = await board_log.append(board_id, "clear", {}, token.get("user_id"))
+    manager.draw_batcher.flush(board_id)
     await manager.broadcast_to_board(board_id, {
-        "type": "clear"
+        "type": "clear",
+        "seq": seq
     })
     return {"status": "success"}
 
@@ -63,7 +63,7 @@ async def clear_board(
 async def send_board_message(
     message: BoardMessageSchema,
     db: AsyncSession = Depends(get_db),
-    token: str = Depends(decode_access_token)
+    token: dict = Depends(get_current_user)
 ):
     board_message = BoardMessage(
         board_id=message.board_id,
@@ -86,6 +86,15 @@ async def send_board_message(
     return {"status": "success"}
 
 
+@router.get("/{board_id}/state")
+async def get_board_state(
+    board_id: str,
+    db: AsyncSession = Depends(get_read_db),
+    token: dict = Depends(get_current_user)
+):
+    return await board_log.get_state(db, board_id)
+
+
 @router.get("/{board_id}/messages")
 async def get_board_messages(
     board_id: str,
@@ -1,22 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
-import csv
-import os
 from fastapi.responses import StreamingResponse
-from app.core.database import get_db
-from app.core.security import RoleChecker, decode_access_token
+from app.core.database import get_read_db
+from app.core.security import RoleChecker
 from app.models.user import User, UserRole
 from app.models.attendance import Attendance
 from app.models.assignment import Assignment
 from app.models.submission import Submission
+from app.services.assignment_stats import (
+    get_assignments_stats,
+    get_single_assignment_stats
+)
+from app.services.user_stats import read_user_stats
+from app.services.export import (
+    COLUMNAR_FORMATS,
+    columnar_available,
+    stream_columnar,
+    stream_csv
+)
 from app.schemas.stats import (
     UserStats,
     ClassStats,
     AssignmentStats,
-    PerformanceTrend
+    PerformanceTrend,
+    ExportRequest
 )
 
 router = APIRouter()
@@ -27,7 +37,7 @@ student_checker = RoleChecker([UserRole.STUDENT])
 
 @router.get("/class", response_model=ClassStats)
 async def get_class_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(teacher_checker)
 ):
     result = await db.execute(
@@ -69,239 +79,55 @@ async def get_class_stats(
 @router.get("/user/{user_id}", response_model=UserStats)
 async def get_user_stats(
     user_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
+    stats = await read_user_stats(db, user_id)
+    if stats is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    result = await db.execute(
-        select(func.count(Attendance.id)).where(Attendance.user_id == user_id)
-    )
-    total_sessions = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.sum(Attendance.session_duration)).where(Attendance.user_id == user_id)
-    )
-    total_duration = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.avg(Attendance.activity_score)).where(Attendance.user_id == user_id)
-    )
-    avg_activity = result.scalar() or 0.0
-    
-    result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.user_id == user_id)
-    )
-    total_assignments = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(
-            and_(
-                Submission.user_id == user_id,
-                Submission.is_correct == 1
-            )
-        )
-    )
-    correct_count = result.scalar() or 0
-    
-    correct_rate = (correct_count / total_assignments * 100) if total_assignments > 0 else 0.0
-    
-    result = await db.execute(
-        select(func.count(Attendance.id))
-        .where(
-            and_(
-                Attendance.user_id == user_id,
-                Attendance.is_late == 1
-            )
-        )
-    )
-    late_count = result.scalar() or 0
-    
-    return UserStats(
-        user_id=user_id,
-        username=user.username,
-        total_sessions=total_sessions,
-        total_duration=total_duration,
-        avg_activity_score=float(avg_activity),
-        total_assignments=total_assignments,
-        correct_rate=correct_rate,
-        late_count=late_count
-    )
+    return stats
 
 
 @router.get("/my-stats", response_model=UserStats)
 async def get_my_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(student_checker)
 ):
-    user_id = token.get("user_id")
-    stats_router = APIRouter()
-    
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
+    stats = await read_user_stats(db, token.get("user_id"))
+    if stats is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    result = await db.execute(
-        select(func.count(Attendance.id)).where(Attendance.user_id == user_id)
-    )
-    total_sessions = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.sum(Attendance.session_duration)).where(Attendance.user_id == user_id)
-    )
-    total_duration = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.avg(Assignment.points)).where(Assignment.id == Submission.assignment_id)
-    )
-    avg_activity = result.scalar() or 0.0
-    
-    result = await db.execute(
-        select(func.count(Submission.id)).where(Submission.user_id == user_id)
-    )
-    total_assignments = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(
-            and_(
-                Submission.user_id == user_id,
-                Submission.is_correct == 1
-            )
-        )
-    )
-    correct_count = result.scalar() or 0
-    
-    correct_rate = (correct_count / total_assignments * 100) if total_assignments > 0 else 0.0
-    
-    result = await db.execute(
-        select(func.count(Attendance.id))
-        .where(
-            and_(
-                Attendance.user_id == user_id,
-                Attendance.is_late == 1
-            )
-        )
-    )
-    late_count = result.scalar() or 0
-    
-    return UserStats(
-        user_id=user_id,
-        username=user.username,
-        total_sessions=total_sessions,
-        total_duration=total_duration,
-        avg_activity_score=float(avg_activity),
-        total_assignments=total_assignments,
-        correct_rate=correct_rate,
-        late_count=late_count
-    )
+    return stats
 
 
 @router.get("/assignment/{assignment_id}", response_model=AssignmentStats)
 async def get_assignment_stats(
     assignment_id: int,
-    db: AsyncSession = Depends(get_db),
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(
-        select(Assignment).where(Assignment.id == assignment_id)
-    )
-    assignment = result.scalar_one_or_none()
-    if not assignment:
+    stats = await get_single_assignment_stats(db, assignment_id, since)
+    if stats is None:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(Submission.assignment_id == assignment_id)
-    )
-    total_submissions = result.scalar() or 0
-    
-    result = await db.execute(
-        select(func.count(Submission.id))
-        .where(
-            and_(
-                Submission.assignment_id == assignment_id,
-                Submission.is_correct == 1
-            )
-        )
-    )
-    correct_count = result.scalar() or 0
-    
-    correct_rate = (correct_count / total_submissions * 100) if total_submissions > 0 else 0.0
-    
-    result = await db.execute(
-        select(func.avg(Submission.score))
-        .where(Submission.assignment_id == assignment_id)
-    )
-    avg_score = result.scalar() or 0.0
-    
-    return AssignmentStats(
-        assignment_id=assignment_id,
-        title=assignment.title,
-        total_submissions=total_submissions,
-        correct_count=correct_count,
-        correct_rate=correct_rate,
-        avg_score=float(avg_score)
-    )
+    return stats
 
 
 @router.get("/assignments/all", response_model=List[AssignmentStats])
 async def get_all_assignments_stats(
-    db: AsyncSession = Depends(get_db),
+    skip: int = 0,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(select(Assignment))
-    assignments = result.scalars().all()
-    
-    stats = []
-    for assignment in assignments:
-        result = await db.execute(
-            select(func.count(Submission.id))
-            .where(Submission.assignment_id == assignment.id)
-        )
-        total_submissions = result.scalar() or 0
-        
-        result = await db.execute(
-            select(func.count(Submission.id))
-            .where(
-                and_(
-                    Submission.assignment_id == assignment.id,
-                    Submission.is_correct == 1
-                )
-            )
-        )
-        correct_count = result.scalar() or 0
-        
-        correct_rate = (correct_count / total_submissions * 100) if total_submissions > 0 else 0.0
-        
-        result = await db.execute(
-            select(func.avg(Submission.score))
-            .where(Submission.assignment_id == assignment.id)
-        )
-        avg_score = result.scalar() or 0.0
-        
-        stats.append(AssignmentStats(
-            assignment_id=assignment.id,
-            title=assignment.title,
-            total_submissions=total_submissions,
-            correct_count=correct_count,
-            correct_rate=correct_rate,
-            avg_score=float(avg_score)
-        ))
-    
-    return stats
+    return await get_assignments_stats(db, since=since, skip=skip, limit=limit)
 
 
 @router.get("/trend/{user_id}")
 async def get_performance_trend(
     user_id: int,
     days: int = 30,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     token: str = Depends(teacher_checker)
 ):
     from datetime import datetime, timedelta
@@ -336,83 +162,164 @@ async def get_performance_trend(
     return trends
 
 
+EXPORT_MEDIA_TYPES = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def check_export_format(params: ExportRequest):
+    if params.format != 'csv' and params.format not in COLUMNAR_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported export format"
+        )
+    if params.format in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="pyarrow is not installed on this server"
+        )
+
+
+def export_response(body, name: str, params: ExportRequest) -> StreamingResponse:
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    if params.format in EXPORT_MEDIA_TYPES:
+        extension, media_type = EXPORT_MEDIA_TYPES[params.format]
+        filename = f"{name}_export_{timestamp}.{extension}"
+    else:
+        filename = f"{name}_export_{timestamp}.csv"
+        media_type = 'text/csv'
+        if params.gzip:
+            filename += '.gz'
+            media_type = 'application/gzip'
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 @router.get("/export/attendance")
 async def export_attendance(
-    db: AsyncSession = Depends(get_db),
+    params: ExportRequest = Depends(),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(
-        select(Attendance, User)
+    check_export_format(params)
+    
+    query = (
+        select(Attendance, User.username)
         .join(User, Attendance.user_id == User.id)
         .order_by(Attendance.login_time.desc())
     )
-    records = result.all()
+    if params.start_date:
+        query = query.where(Attendance.login_time >= params.start_date)
+    if params.end_date:
+        query = query.where(Attendance.login_time <= params.end_date)
     
-    output = []
-    output.append(['User ID', 'Username', 'Login Time', 'Logout Time', 'Duration (seconds)', 'Activity Score', 'Is Late'])
+    header = ['User ID', 'Username', 'Login Time', 'Logout Time', 'Duration (seconds)', 'Activity Score', 'Is Late']
     
-    for attendance, user in records:
-        output.append([
+    def to_row(row):
+        attendance, username = row
+        return [
             attendance.user_id,
-            user.username,
+            username,
             attendance.login_time.isoformat() if attendance.login_time else '',
             attendance.logout_time.isoformat() if attendance.logout_time else '',
             str(attendance.session_duration),
             str(attendance.activity_score),
             'Yes' if attendance.is_late else 'No'
-        ])
-    
-    filename = f"attendance_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    filepath = f"/tmp/{filename}"
-    
-    with open(filepath, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(output)
+        ]
+    
+    if params.format in COLUMNAR_FORMATS:
+        columns = [
+            ('user_id', 'int64'),
+            ('username', 'string'),
+            ('login_time', 'timestamp[us]'),
+            ('logout_time', 'timestamp[us]'),
+            ('session_duration', 'int64'),
+            ('activity_score', 'float64'),
+            ('is_late', 'bool')
+        ]
+        
+        def to_record(row):
+            attendance, username = row
+            return (
+                attendance.user_id,
+                username,
+                attendance.login_time,
+                attendance.logout_time,
+                attendance.session_duration,
+                attendance.activity_score,
+                bool(attendance.is_late)
+            )
+        
+        body = stream_columnar(query, columns, to_record, format=params.format)
+    else:
+        body = stream_csv(query, header, to_row, gzip=params.gzip)
     
-    return StreamingResponse(
-        open(filepath, 'rb'),
-        media_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    return export_response(body, 'attendance', params)
 
 
 @router.get("/export/assignments")
 async def export_assignments(
-    db: AsyncSession = Depends(get_db),
+    params: ExportRequest = Depends(),
     token: str = Depends(teacher_checker)
 ):
-    result = await db.execute(
-        select(Submission, Assignment, User)
+    check_export_format(params)
+    
+    query = (
+        select(Submission, Assignment.title, User.username)
         .join(Assignment, Submission.assignment_id == Assignment.id)
         .join(User, Submission.user_id == User.id)
         .order_by(Submission.submitted_at.desc())
     )
-    records = result.all()
+    if params.start_date:
+        query = query.where(Submission.submitted_at >= params.start_date)
+    if params.end_date:
+        query = query.where(Submission.submitted_at <= params.end_date)
     
-    output = []
-    output.append(['User ID', 'Username', 'Assignment ID', 'Title', 'Answer', 'Is Correct', 'Score', 'Submitted At'])
+    header = ['User ID', 'Username', 'Assignment ID', 'Title', 'Answer', 'Is Correct', 'Score', 'Submitted At']
     
-    for submission, assignment, user in records:
-        output.append([
+    def to_row(row):
+        submission, title, username = row
+        return [
             submission.user_id,
-            user.username,
+            username,
             submission.assignment_id,
-            assignment.title,
+            title,
             submission.student_answer,
             'Yes' if submission.is_correct else 'No',
             str(submission.score),
             submission.submitted_at.isoformat() if submission.submitted_at else ''
-        ])
-    
-    filename = f"assignments_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-    filepath = f"/tmp/{filename}"
-    
-    with open(filepath, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(output)
+        ]
+    
+    if params.format in COLUMNAR_FORMATS:
+        columns = [
+            ('user_id', 'int64'),
+            ('username', 'string'),
+            ('assignment_id', 'int64'),
+            ('title', 'string'),
+            ('student_answer', 'string'),
+            ('is_correct', 'bool'),
+            ('score', 'float64'),
+            ('submitted_at', 'timestamp[us]')
+        ]
+        
+        def to_record(row):
+            submission, title, username = row
+            return (
+                submission.user_id,
+                username,
+                submission.assignment_id,
+                title,
+                submission.student_answer,
+                None if submission.is_correct is None else bool(submission.is_correct),
+                submission.score,
+                submission.submitted_at
+            )
+        
+        body = stream_columnar(query, columns, to_record, format=params.format)
+    else:
+        body = stream_csv(query, header, to_row, gzip=params.gzip)
     
-    return StreamingResponse(
-        open(filepath, 'rb'),
-        media_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    return export_response(body, 'assignments', params)
@@ -3,6 +3,7 @@ import psutil
 import time
 import os
 from app.core.security import RoleChecker
+from app.core.password_pool import password_pool
 from app.models.user import UserRole
 from app.schemas.stats import SystemInfo
 from typing import List
@@ -95,3 +96,8 @@ async def get_processes(token: str = Depends(admin_checker)):
     
     processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
     return {"processes": processes[:20]}
+
+
+@router.get("/password-pool")
+async def get_password_pool_metrics(token: str = Depends(admin_checker)):
+    return password_pool.metrics()
@@ -3,9 +3,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from app.core.database import get_db
-from app.core.security import RoleChecker, decode_access_token
+from app.core.security import RoleChecker
 from app.models.user import User, UserRole
 from app.schemas.user import UserResponse, UserUpdate
+from app.services.user_stats import delete_user_stats
 
 router = APIRouter()
 
@@ -85,6 +86,8 @@ async def delete_user(
             detail="User not found"
         )
     
+    # 签到和提交随用户级联删除，统计行只属于这个用户，直接删掉
+    await delete_user_stats(db, user_id)
     await db.delete(db_user)
     await db.commit()
     return {"message": "User deleted successfully"}
@@ -6,8 +6,26 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7
+    TOKEN_CACHE_SIZE: int = 1024
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+    
+    PASSWORD_PBKDF2_ITERATIONS: int = 120000
+    PASSWORD_WORKERS: int = 2
+    PASSWORD_QUEUE_LIMIT: int = 64
+    PASSWORD_RETRY_AFTER_SECONDS: int = 2
     
     DATABASE_URL: str = "sqlite+aiosqlite:///./data/lms.db"
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_READ_POOL_SIZE: int = 4
+    DB_READ_MAX_OVERFLOW: int = 4
+    DB_POOL_TIMEOUT: int = 30
+    DB_JOURNAL_MODE: str = "WAL"
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_CACHE_SIZE: int = -16000
+    DB_BUSY_TIMEOUT_MS: int = 5000
     
     HOST: str = "0.0.0.0"
     PORT: int = 8000
@@ -20,8 +38,21 @@ class Settings(BaseSettings):
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024
     
     WEBSOCKET_HEARTBEAT_INTERVAL: int = 30
+    WEBSOCKET_SEND_QUEUE_SIZE: int = 256
+    WEBSOCKET_SEND_TIMEOUT: float = 5.0
+    PRESENCE_COALESCE_MS: int = 200
+    WHITEBOARD_BATCH_TICK_MS: int = 25
+    WHITEBOARD_MIN_POINT_DISTANCE: float = 1.0
+    BOARD_LOG_FLUSH_MS: int = 200
+    BOARD_SNAPSHOT_EVERY: int = 200
+    BOARD_RESUME_EVENTS: int = 1000
+    BOARD_LOG_MAX_PENDING: int = 5000
+    BOARD_LOG_RETRY_MAX_MS: int = 30000
     
     SIGNIN_TIMEOUT_MINUTES: int = 5
+    ONLINE_TIMEOUT_SECONDS: int = 300
+    
+    EXPORT_CHUNK_ROWS: int = 500
     
     class Config:
         env_file = ".env"
@@ -1,17 +1,66 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from app.core.config import settings
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 os.makedirs(settings.DATA_DIR, exist_ok=True)
 os.makedirs(settings.STATIC_DIR, exist_ok=True)
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 os.makedirs(settings.LOGS_DIR, exist_ok=True)
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+IS_SQLITE = "sqlite" in settings.DATABASE_URL
+
+
+def sqlite_pragmas(read_only: bool = False) -> list:
+    pragmas = [
+        f"PRAGMA journal_mode={settings.DB_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.DB_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={settings.DB_MMAP_SIZE}",
+        f"PRAGMA cache_size={settings.DB_CACHE_SIZE}",
+        f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def make_engine(pool_size: int, max_overflow: int, read_only: bool = False):
+    new_engine = create_async_engine(
+        settings.DATABASE_URL,
+        echo=settings.DB_ECHO,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=not IS_SQLITE,
+        connect_args={"check_same_thread": False} if IS_SQLITE else {}
+    )
+
+    if IS_SQLITE:
+        pragmas = sqlite_pragmas(read_only)
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return new_engine
+
+
+engine = make_engine(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+
+# 统计/导出走独立的只读连接池，WAL 模式下读不会阻塞作业提交的写入
+read_engine = make_engine(
+    settings.DB_READ_POOL_SIZE,
+    settings.DB_READ_MAX_OVERFLOW,
+    read_only=True
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -20,6 +69,12 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -31,10 +86,53 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def dispose_engines():
+    # aiosqlite 的连接线程不是守护线程，关闭前必须释放连接池
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+async def create_tables():
+    from app.models import user, attendance, assignment, submission, board, user_stats
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+
+
+def add_missing_columns(connection):
+    """create_all 不会给已有的表加列：把模型里新增的可空列补上，连同用到它们的索引"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if not missing:
+            continue
+        for column in missing:
+            if not column.nullable or column.primary_key:
+                raise RuntimeError(f"{table.name}.{column.name} is missing and cannot be added automatically, "
+                                   f"migrate the database first")
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            logger.info(f"Added column {table.name}.{column.name}")
+        added = {column.name for column in missing}
+        for index in table.indexes:
+            if added & {column.name for column in index.columns}:
+                index.create(connection, checkfirst=True)
+
+
 def init_db():
+    """给脚本用的同步入口；应用启动时在事件循环里直接 await create_tables()"""
     import asyncio
-    from app.models import user, attendance, assignment, submission, board
-    async def create_tables():
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-    asyncio.run(create_tables())
+    async def run():
+        await create_tables()
+        # 连接池里的连接属于这个临时事件循环，交还给应用前先释放
+        await engine.dispose()
+    asyncio.run(run())
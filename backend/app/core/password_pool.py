@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable
+from app.core.config import settings
+import asyncio
+import threading
+import time
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+class _Timings:
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        def percentile(q):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+        return {
+            "count": self.count,
+            "avg_ms": (self.total / self.count * 1000) if self.count else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": self.max * 1000,
+        }
+
+
+class PasswordWorkerPool:
+    """PBKDF2 密码哈希、校验及旧哈希升级专用线程池，排队数超过上限时直接拒绝，避免阻塞事件循环"""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self.pending = 0
+        self.rejected = 0
+        self.queue_wait = _Timings()
+        self.hash_time = _Timings()
+        self._lock = threading.Lock()
+
+    async def run(self, fn: Callable, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+
+        self.pending += 1
+        enqueued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.queue_wait.add(started - enqueued)
+                    self.hash_time.add(finished - started)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, job)
+        finally:
+            self.pending -= 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "pending": self.pending,
+                "rejected": self.rejected,
+                "queue_wait": self.queue_wait.summary(),
+                "hash_time": self.hash_time.summary(),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+password_pool = PasswordWorkerPool(settings.PASSWORD_WORKERS, settings.PASSWORD_QUEUE_LIMIT)
@@ -1,21 +1,59 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+import hashlib
+import threading
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.config import settings
+from app.core.password_pool import password_pool, PasswordPoolSaturated
+from app.core import simple_security
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# 已验证的 token 声明缓存：key 为 token 的 SHA-256，value 为 (payload, 过期时间戳)
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return simple_security.verify_password(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return simple_security.hash_password(password, settings.PASSWORD_PBKDF2_ITERATIONS)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return simple_security.verify_and_update(
+        plain_password,
+        hashed_password,
+        settings.PASSWORD_PBKDF2_ITERATIONS
+    )
+
+
+def _password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": str(settings.PASSWORD_RETRY_AFTER_SECONDS)}
+    )
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    try:
+        return await password_pool.run(verify_and_update_password, plain_password, hashed_password)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
+
+
+async def get_password_hash_async(password: str) -> str:
+    try:
+        return await password_pool.run(get_password_hash, password)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -29,25 +67,62 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def decode_access_token(token: str) -> Optional[dict]:
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+def _cached_claims(key: str, now: float) -> Optional[dict]:
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= now:
+            del _token_cache[key]
+            return None
+        _token_cache.move_to_end(key)
         return payload
-    except JWTError:
+
+
+def _cache_claims(key: str, payload: dict, now: float):
+    expires_at = now + settings.TOKEN_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if exp is not None:
+        expires_at = min(expires_at, float(exp))
+    with _token_cache_lock:
+        _token_cache[key] = (payload, expires_at)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+
+def decode_access_token(token: str) -> Optional[dict]:
+    if not token:
         return None
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    payload = _cached_claims(key, now)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        _cache_claims(key, payload, now)
+    # 缓存里的声明被多个请求共享，返回副本，调用方修改不会影响缓存
+    return dict(payload)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    payload = decode_access_token(token)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+    return payload
 
 
 class RoleChecker:
     def __init__(self, allowed_roles: list):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, token: str = Depends(oauth2_scheme)):
-        payload = decode_access_token(token)
-        if payload is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
+    def __call__(self, payload: dict = Depends(get_current_user)):
         user_role: str = payload.get("role")
         if user_role not in self.allowed_roles:
             raise HTTPException(
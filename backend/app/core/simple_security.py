@@ -1,22 +1,156 @@
 #!/usr/bin/env python3
 """
-LMS-Edge Simple Password Hash - 不需要 bcrypt
+LMS-Edge Password Hash - 统一密码哈希，不依赖 bcrypt
+
+新密码使用 PBKDF2-SHA256（加盐，迭代次数可调），格式：
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+同时可以校验旧格式：
+    - 无盐 SHA-256 十六进制（Flask 服务旧数据）
+    - bcrypt $2a$/$2b$/$2y$（FastAPI 旧数据，需要安装 bcrypt）
+旧格式或迭代次数过低的哈希在登录成功后由 verify_and_update 返回新哈希。
+
+迭代次数由环境变量 PASSWORD_PBKDF2_ITERATIONS 配置，用本文件的
+--benchmark 模式在目标硬件上挑选。
 """
 
+import base64
 import hashlib
+import hmac
+import os
+import re
+
+ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 120000))
+SALT_BYTES = 16
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def identify(password_hash):
+    """返回哈希格式：pbkdf2_sha256 / sha256 / bcrypt，无法识别时返回 None"""
+    if not password_hash:
+        return None
+    if password_hash.startswith(ALGORITHM + '$'):
+        return ALGORITHM
+    if password_hash.startswith(('$2a$', '$2b$', '$2y$')):
+        return 'bcrypt'
+    if _LEGACY_SHA256.match(password_hash):
+        return 'sha256'
+    return None
+
+
+def hash_password(password, iterations=None):
+    """PBKDF2-SHA256 加盐哈希"""
+    iterations = iterations or DEFAULT_ITERATIONS
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f'{ALGORITHM}${iterations}${_b64(salt)}${_b64(digest)}'
 
-def hash_password(password):
-    """简单哈希密码"""
-    return hashlib.sha256(password.encode()).hexdigest()
 
 def verify_password(password, password_hash):
-    """验证密码"""
-    return hash_password(password) == password_hash
+    """验证密码，兼容旧的 SHA-256 和 bcrypt 哈希"""
+    scheme = identify(password_hash)
+    if scheme == ALGORITHM:
+        try:
+            _, iterations, salt, expected = password_hash.split('$')
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), _unb64(salt), int(iterations))
+        except (ValueError, TypeError):
+            return False
+        return hmac.compare_digest(digest, _unb64(expected))
+    if scheme == 'sha256':
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, password_hash)
+    if scheme == 'bcrypt' and bcrypt is not None:
+        try:
+            return bcrypt.checkpw(password.encode(), password_hash.encode())
+        except ValueError:
+            return False
+    return False
+
+
+def needs_rehash(password_hash, iterations=None):
+    """旧格式或迭代次数低于当前配置时需要重新哈希"""
+    iterations = iterations or DEFAULT_ITERATIONS
+    if identify(password_hash) != ALGORITHM:
+        return True
+    try:
+        return int(password_hash.split('$')[1]) < iterations
+    except (IndexError, ValueError):
+        return True
+
+
+def verify_and_update(password, password_hash, iterations=None):
+    """验证密码；成功且需要升级时返回 (True, 新哈希)，否则新哈希为 None"""
+    if not verify_password(password, password_hash):
+        return False, None
+    if needs_rehash(password_hash, iterations):
+        return True, hash_password(password, iterations)
+    return True, None
+
+
+def benchmark(candidates, logins=60, workers=None, target_p99_ms=2000):
+    """模拟一次全班同时登录，返回每个迭代次数的 p99 延迟和推荐值"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    results = []
+    for iterations in candidates:
+        stored = hash_password('benchmark-password', iterations)
+
+        def login(submitted_at):
+            verify_password('benchmark-password', stored)
+            return (time.perf_counter() - submitted_at) * 1000
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            futures = [pool.submit(login, start) for _ in range(logins)]
+            latencies = sorted(f.result() for f in futures)
+        p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+        results.append((iterations, latencies[0], p99))
+
+    passing = [iterations for iterations, _, p99 in results if p99 <= target_p99_ms]
+    return results, max(passing) if passing else None
+
 
 if __name__ == '__main__':
-    # 测试
-    pwd = "admin123"
-    hashed = hash_password(pwd)
-    print(f"Original: {pwd}")
-    print(f"Hashed: {hashed}")
-    print(f"Verified: {verify_password(pwd, hashed)}")
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark PBKDF2 cost for a classroom login storm')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--logins', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--target-p99-ms', type=float, default=2000)
+    parser.add_argument('--iterations', type=int, nargs='*',
+                        default=[50000, 100000, 200000, 300000, 600000])
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        pwd = "admin123"
+        hashed = hash_password(pwd)
+        print(f"Original: {pwd}")
+        print(f"Hashed: {hashed}")
+        print(f"Verified: {verify_password(pwd, hashed)}")
+        raise SystemExit(0)
+
+    results, recommended = benchmark(args.iterations, args.logins, args.workers, args.target_p99_ms)
+    print(f"{args.logins} concurrent logins, target p99 {args.target_p99_ms:.0f} ms")
+    for iterations, single, p99 in results:
+        print(f"  iterations={iterations:>8}  first={single:8.1f} ms  p99={p99:8.1f} ms")
+    if recommended:
+        print(f"Recommended: PASSWORD_PBKDF2_ITERATIONS={recommended}")
+    else:
+        print("No candidate meets the target; lower the iteration count or raise the target")
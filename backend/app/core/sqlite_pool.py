@@ -0,0 +1,101 @@
+"""
+LMS-Edge SQLite Pool - Flask 服务的 SQLite 连接池
+
+连接建好时执行一次 PRAGMA（WAL、synchronous=NORMAL、cache_size、mmap_size、
+temp_store=MEMORY），之后反复复用；sqlite3 模块按连接缓存预编译语句，
+复用连接也就复用了同一条 SQL 的 prepared statement。
+
+close() 不真正关闭连接，而是还给连接池；还回来时如果还在事务里先回滚。
+只依赖标准库，线程安全。
+"""
+
+import queue
+import sqlite3
+import threading
+
+
+def default_pragmas(cache_size=-16000, mmap_size=64 * 1024 * 1024, busy_timeout_ms=30000):
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA cache_size={cache_size}',
+        f'PRAGMA mmap_size={mmap_size}',
+        'PRAGMA temp_store=MEMORY',
+        f'PRAGMA busy_timeout={busy_timeout_ms}',
+    ]
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    # 绑定在某个请求上的连接由请求结束时统一归还，中途的 close() 什么也不做
+    request_bound = False
+
+    def close(self):
+        if self.request_bound:
+            return
+        if self.pool is None:
+            super().close()
+            return
+        self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class SQLitePool:
+    def __init__(self, path, size=8, pragmas=None, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.pragmas = default_pragmas() if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=max(size, 1))
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        conn.pool = self
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        conn.request_bound = False
+        return conn
+
+    def release(self, conn):
+        conn.request_bound = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        if self.size <= 0:
+            conn.really_close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.really_close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                return
@@ -1,13 +1,17 @@
-from sqlalchemy import Column, Integer, Text, DateTime, String, JSON, ForeignKey
+from sqlalchemy import Column, Integer, Text, DateTime, String, JSON, ForeignKey, Index
 from datetime import datetime
 from app.core.database import Base
 
 
 class BoardLog(Base):
     __tablename__ = "board_logs"
+    __table_args__ = (
+        Index("ix_board_logs_board_seq", "board_id", "seq"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     board_id = Column(String(50), index=True, nullable=False)
+    seq = Column(Integer, nullable=True)
     content = Column(JSON, nullable=False)
     action_type = Column(String(50), default="draw")
     created_by = Column(Integer, nullable=False)
@@ -17,6 +21,9 @@ class BoardLog(Base):
 
 class BoardMessage(Base):
     __tablename__ = "board_messages"
+    __table_args__ = (
+        Index("ix_board_messages_board_created", "board_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     board_id = Column(String(50), index=True, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -6,6 +6,12 @@ from app.core.database import Base
 
 class Submission(Base):
     __tablename__ = "submissions"
+    __table_args__ = (
+        # 包含 score，作业统计的分组聚合可以只扫索引
+        Index("ix_submissions_assignment_correct", "assignment_id", "is_correct", "score"),
+        Index("ix_submissions_user_correct", "user_id", "is_correct"),
+        Index("ix_submissions_user_assignment", "user_id", "assignment_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
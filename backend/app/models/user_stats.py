@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, DateTime, Float, ForeignKey
+from datetime import datetime
+from app.core.database import Base
+
+
+class UserStatsRollup(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_sessions = Column(Integer, default=0, nullable=False)
+    total_duration = Column(Integer, default=0, nullable=False)
+    activity_sum = Column(Float, default=0.0, nullable=False)
+    total_submissions = Column(Integer, default=0, nullable=False)
+    correct_count = Column(Integer, default=0, nullable=False)
+    late_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
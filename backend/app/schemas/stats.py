@@ -56,7 +56,8 @@ class LogEntry(BaseModel):
 
 
 class ExportRequest(BaseModel):
-    start_date: Optional[str] = None
-    end_date: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
     format: str = "csv"
     type: str = "attendance"
+    gzip: bool = False
@@ -0,0 +1,75 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, and_, case
+from typing import List, Optional
+from datetime import datetime
+from app.models.assignment import Assignment
+from app.models.submission import Submission
+from app.schemas.stats import AssignmentStats
+
+
+def assignment_stats_query(
+    assignment_id: Optional[int] = None,
+    since: Optional[datetime] = None
+):
+    """按作业分组，一次查询算出提交数、正确数和平均分"""
+    join_on = Submission.assignment_id == Assignment.id
+    if since is not None:
+        join_on = and_(join_on, Submission.submitted_at >= since)
+
+    query = (
+        select(
+            Assignment.id.label("assignment_id"),
+            Assignment.title.label("title"),
+            func.count(Submission.id).label("total_submissions"),
+            func.coalesce(
+                func.sum(case((Submission.is_correct == 1, 1), else_=0)), 0
+            ).label("correct_count"),
+            func.coalesce(func.avg(Submission.score), 0.0).label("avg_score")
+        )
+        .select_from(Assignment)
+        .outerjoin(Submission, join_on)
+        .group_by(Assignment.id, Assignment.title)
+        .order_by(Assignment.id)
+    )
+    if assignment_id is not None:
+        query = query.where(Assignment.id == assignment_id)
+    return query
+
+
+def row_to_stats(row) -> AssignmentStats:
+    total_submissions = row.total_submissions or 0
+    correct_count = row.correct_count or 0
+    correct_rate = (correct_count / total_submissions * 100) if total_submissions > 0 else 0.0
+    return AssignmentStats(
+        assignment_id=row.assignment_id,
+        title=row.title,
+        total_submissions=total_submissions,
+        correct_count=correct_count,
+        correct_rate=correct_rate,
+        avg_score=float(row.avg_score or 0.0)
+    )
+
+
+async def get_assignments_stats(
+    db: AsyncSession,
+    since: Optional[datetime] = None,
+    skip: int = 0,
+    limit: Optional[int] = None
+) -> List[AssignmentStats]:
+    query = assignment_stats_query(since=since).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return [row_to_stats(row) for row in result]
+
+
+async def get_single_assignment_stats(
+    db: AsyncSession,
+    assignment_id: int,
+    since: Optional[datetime] = None
+) -> Optional[AssignmentStats]:
+    result = await db.execute(assignment_stats_query(assignment_id, since))
+    row = result.first()
+    if row is None:
+        return None
+    return row_to_stats(row)
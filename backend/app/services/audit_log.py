@@ -0,0 +1,111 @@
+"""
+LMS-Edge Audit Log - operation_logs 的异步批量写入
+
+请求里只把操作记录放进内存队列就返回，后台线程每 flush_interval 秒或攒够
+batch_size 条时在一个事务里批量插入。队列有上限，满了丢弃新记录并计数，
+不会因为数据库慢拖住请求或者占满内存。created_at 取入队时间，批量写入
+不改变记录的先后顺序。进程退出前调用 close() 把剩下的记录写完。
+只依赖标准库，线程安全，Flask 服务和 full_server.py 共用。
+"""
+
+import collections
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = '''INSERT INTO operation_logs (user_id, username, action, target, details, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)'''
+
+
+class AuditLog:
+    def __init__(self, connect, flush_interval=0.3, batch_size=200, max_pending=10000):
+        self._connect = connect
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self._writer = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._writer.start()
+
+    def record(self, user_id, username, action, target, details):
+        """入队一条操作记录，队列满时丢弃并返回 False"""
+        # 与 SQLite CURRENT_TIMESTAMP 同样的 UTC 格式，新旧记录可以一起排序
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(f'Audit log queue full, {self.dropped} records dropped so far')
+                return False
+            self._pending.append((user_id, username, action, target, details, created_at))
+            # 刚攒够一批时叫醒写线程；写失败积压期间不会每条都叫醒
+            if len(self._pending) == self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                # 上一轮写失败时至少等一个周期再重试，不空转
+                if not self._closed and (failed or len(self._pending) < self.batch_size):
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            failed = not self.flush()
+
+    def flush(self):
+        """把队列里的记录全部写入，每 batch_size 条一个事务；写失败返回 False"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch:
+                    return True
+                if not self._write(batch):
+                    return False
+
+    def _write(self, batch):
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            conn.executemany(INSERT_SQL, batch)
+            conn.execute('COMMIT')
+        except Exception:
+            logger.exception(f'Failed to write {len(batch)} audit log records')
+            if conn is not None and conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # 放回队首等下一轮重试，超出上限的部分算作丢弃
+            with self._cond:
+                self._pending.extendleft(reversed(batch))
+                while len(self._pending) > self.max_pending:
+                    self._pending.pop()
+                    self.dropped += 1
+            return False
+        finally:
+            if conn is not None:
+                conn.close()
+        with self._cond:
+            self.written += len(batch)
+        return True
+
+    def close(self):
+        """停止后台线程并写完剩下的记录"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._writer.is_alive() and self._writer is not threading.current_thread():
+            self._writer.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {'pending': len(self._pending), 'written': self.written, 'dropped': self.dropped}
@@ -0,0 +1,317 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, func
+from typing import Deque, Dict, List, Optional
+from collections import deque
+from datetime import datetime
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.board import BoardLog
+import asyncio
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(settings.DATA_DIR, "boards")
+
+
+def snapshot_file(board_id: str, last_event_id: int) -> str:
+    # board_id 来自客户端，不能直接拼进路径
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", board_id)
+    return os.path.join(SNAPSHOT_DIR, safe_id, f"snapshot-{last_event_id}.json")
+
+
+def _write_json_atomic(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"), default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compact(strokes: List[dict], rows) -> List[dict]:
+    """把事件叠加到快照的笔画列表上，遇到清屏就丢掉之前的全部笔画"""
+    strokes = list(strokes)
+    for row in rows:
+        if row.action_type == "clear":
+            strokes = []
+        else:
+            strokes.append({**row.content, "created_by": row.created_by})
+    return strokes
+
+
+def row_to_event(row: BoardLog) -> dict:
+    return {
+        "id": row.id,
+        "seq": row.seq,
+        "action_type": row.action_type,
+        "content": row.content,
+        "created_by": row.created_by,
+        "created_at": row.created_at
+    }
+
+
+class BoardEventLog:
+    """
+    白板事件日志：事件先在内存里按白板缓冲，每 BOARD_LOG_FLUSH_MS 一次批量插入
+    （一次提交代替每笔一次 fsync），累计 BOARD_SNAPSHOT_EVERY 条后写一份压缩快照。
+    写入失败时按指数退避重试；每个白板最多缓冲 BOARD_LOG_MAX_PENDING 条，
+    超出时丢弃最旧的事件并计入 dropped，数据库长时间不可用或某条坏数据不会让内存无限增长。
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.interval = settings.BOARD_LOG_FLUSH_MS / 1000
+        self.snapshot_every = settings.BOARD_SNAPSHOT_EVERY
+        self.max_pending = settings.BOARD_LOG_MAX_PENDING
+        self.retry_max = settings.BOARD_LOG_RETRY_MAX_MS / 1000
+        self.dropped = 0
+        self._failures: Dict[str, int] = {}
+        self._buffers: Dict[str, List[dict]] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._since_snapshot: Dict[str, int] = {}
+        # 每个白板单调递增的序号，以及最近事件的环形缓冲，断线重连直接从内存续传
+        self._seq: Dict[str, int] = {}
+        self._recent: Dict[str, Deque[dict]] = {}
+
+    async def _ensure_seq(self, board_id: str):
+        if board_id in self._seq:
+            return
+        async with self._locks.setdefault(board_id, asyncio.Lock()):
+            if board_id in self._seq:
+                return
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    select(func.max(BoardLog.seq)).where(BoardLog.board_id == board_id)
+                )
+            self._seq[board_id] = result.scalar() or 0
+            self._recent[board_id] = deque(maxlen=settings.BOARD_RESUME_EVENTS)
+
+    async def append(self, board_id: str, action_type: str, content: dict, created_by: int) -> int:
+        """记录一条事件，返回它在该白板上的序号"""
+        await self._ensure_seq(board_id)
+        seq = self._seq[board_id] + 1
+        self._seq[board_id] = seq
+        event = {
+            "board_id": board_id,
+            "seq": seq,
+            "content": content,
+            "action_type": action_type,
+            "created_by": created_by,
+            "created_at": datetime.utcnow()
+        }
+        self._recent[board_id].append(event)
+        self._buffers.setdefault(board_id, []).append(event)
+        self._trim(board_id)
+        # 退避中的重试任务也在 _flush_tasks 里，不会被新事件提前
+        self._schedule(board_id, self.interval)
+        return seq
+
+    def _schedule(self, board_id: str, delay: float):
+        if board_id not in self._flush_tasks:
+            self._flush_tasks[board_id] = asyncio.create_task(self._flush_later(board_id, delay))
+
+    def _trim(self, board_id: str):
+        """缓冲区超过上限时丢掉最旧的事件"""
+        rows = self._buffers.get(board_id)
+        excess = len(rows) - self.max_pending if rows else 0
+        if excess > 0:
+            del rows[:excess]
+            before, self.dropped = self.dropped, self.dropped + excess
+            if before == 0 or before // 1000 != self.dropped // 1000:
+                logger.warning(f"Board log buffer for {board_id} is full, {self.dropped} events dropped so far")
+
+    async def _flush_later(self, board_id: str, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flush_tasks.pop(board_id, None)
+        await self.flush(board_id)
+
+    async def flush(self, board_id: str):
+        lock = self._locks.setdefault(board_id, asyncio.Lock())
+        async with lock:
+            rows = self._buffers.pop(board_id, None)
+            if not rows:
+                return
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(BoardLog), rows)
+                    await db.commit()
+            except Exception:
+                # 写失败时把事件放回缓冲区头部，退避后重试
+                failures = self._failures.get(board_id, 0) + 1
+                self._failures[board_id] = failures
+                delay = min(self.interval * 2 ** failures, self.retry_max)
+                logger.exception(f"Failed to flush {len(rows)} board events for {board_id}, "
+                                 f"retry #{failures} in {delay:.1f}s")
+                self._buffers[board_id] = rows + self._buffers.get(board_id, [])
+                self._trim(board_id)
+                self._schedule(board_id, delay)
+                return
+
+            self._failures.pop(board_id, None)
+            count = self._since_snapshot.get(board_id, 0) + len(rows)
+            self._since_snapshot[board_id] = count
+            if count >= self.snapshot_every:
+                try:
+                    await self.snapshot(board_id)
+                    self._since_snapshot[board_id] = 0
+                except Exception:
+                    logger.exception(f"Failed to snapshot board {board_id}")
+
+    async def flush_all(self):
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        self._flush_tasks.clear()
+        for board_id in list(self._buffers):
+            await self.flush(board_id)
+        # 关闭时仍然写不进去的事件不再重试
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        self._flush_tasks.clear()
+        lost = sum(len(rows) for rows in self._buffers.values())
+        if lost:
+            logger.error(f"{lost} board events could not be written before shutdown")
+
+    async def latest_snapshot(self, db: AsyncSession, board_id: str):
+        """返回 (快照内容, 快照覆盖到的事件 id)，没有可用快照时为 (None, 0)"""
+        result = await db.execute(
+            select(BoardLog.id, BoardLog.snapshot_path)
+            .where(BoardLog.board_id == board_id, BoardLog.snapshot_path.isnot(None))
+            .order_by(BoardLog.id.desc())
+            .limit(1)
+        )
+        row = result.first()
+        if row is None:
+            return None, 0
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, _read_json, row.snapshot_path)
+        if data is None:
+            logger.warning(f"Snapshot {row.snapshot_path} is missing or unreadable")
+            return None, 0
+        return data, row.id
+
+    async def tail(self, db: AsyncSession, board_id: str, after_id: int) -> List[BoardLog]:
+        result = await db.execute(
+            select(BoardLog)
+            .where(BoardLog.board_id == board_id, BoardLog.id > after_id)
+            .order_by(BoardLog.id)
+        )
+        return result.scalars().all()
+
+    async def snapshot(self, board_id: str) -> Optional[str]:
+        """在上一份快照的基础上叠加新事件，写出新快照并记到最后一条事件的 snapshot_path"""
+        async with self.session_factory() as db:
+            previous, last_id = await self.latest_snapshot(db, board_id)
+            rows = await self.tail(db, board_id, last_id)
+            if not rows:
+                return None
+
+            strokes = compact(previous["strokes"] if previous else [], rows)
+            last_id = rows[-1].id
+            path = snapshot_file(board_id, last_id)
+            data = {
+                "board_id": board_id,
+                "last_event_id": last_id,
+                "last_seq": rows[-1].seq,
+                "created_at": datetime.utcnow(),
+                "strokes": strokes
+            }
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _write_json_atomic, path, data)
+
+            await db.execute(update(BoardLog).where(BoardLog.id == last_id).values(snapshot_path=path))
+            await db.commit()
+
+        if previous:
+            old_path = snapshot_file(board_id, previous["last_event_id"])
+            if old_path != path and os.path.exists(old_path):
+                os.remove(old_path)
+        logger.info(f"Board {board_id} snapshot at event {last_id} ({len(strokes)} strokes)")
+        return path
+
+    async def get_state(self, db: AsyncSession, board_id: str) -> dict:
+        """最新快照加上快照之后的事件；先刷新缓冲区，保证刚画的笔画也能拿到"""
+        await self.flush(board_id)
+        snapshot, last_id = await self.latest_snapshot(db, board_id)
+        rows = await self.tail(db, board_id, last_id)
+        events = [row_to_event(row) for row in rows]
+        seqs = [event["seq"] for event in events if event["seq"]]
+        return {
+            "board_id": board_id,
+            "seq": max(seqs) if seqs else (snapshot or {}).get("last_seq") or 0,
+            "snapshot": snapshot,
+            "snapshot_event_id": last_id,
+            "events": events
+        }
+
+    def events_since(self, board_id: str, since: int) -> Optional[List[dict]]:
+        """从内存环形缓冲里取 since 之后的事件；缓冲区已经覆盖不到时返回 None"""
+        current = self._seq.get(board_id)
+        if current is None or since > current:
+            return None
+        recent = self._recent[board_id]
+        if since < current and (not recent or recent[0]["seq"] > since + 1):
+            return None
+        return [self._to_sync_event(event) for event in recent if event["seq"] > since]
+
+    @staticmethod
+    def _to_sync_event(event: dict) -> dict:
+        return {
+            "seq": event["seq"],
+            "action_type": event["action_type"],
+            "content": event["content"],
+            "created_by": event["created_by"]
+        }
+
+    async def load_sync_state(self, db: AsyncSession, board_id: str, since: Optional[int] = None) -> dict:
+        """
+        连接时下发的初始状态：客户端带着 since 且内存里还接得上时只发增量，
+        否则发快照加尾部事件（reset=True，客户端先清空画布）。
+        """
+        await self._ensure_seq(board_id)
+        if since is not None:
+            events = self.events_since(board_id, since)
+            if events is not None:
+                seq = events[-1]["seq"] if events else since
+                return {"board_id": board_id, "reset": False, "seq": seq, "events": events}
+
+        state = await self.get_state(db, board_id)
+        return {
+            "board_id": board_id,
+            "reset": True,
+            "seq": state["seq"],
+            "strokes": (state["snapshot"] or {}).get("strokes", []),
+            "events": [
+                {key: event[key] for key in ("seq", "action_type", "content", "created_by")}
+                for event in state["events"]
+            ]
+        }
+
+    def top_up(self, state: dict) -> dict:
+        """
+        补上加载状态期间新产生的事件。必须在把连接加入白板广播的同一步里同步调用，
+        这样之后的事件一定走实时广播，中间不会漏；重复的由客户端按序号丢弃。
+        """
+        extra = self.events_since(state["board_id"], state["seq"]) or []
+        events = state["events"] + extra
+        if events:
+            state["seq"] = max(state["seq"], events[-1]["seq"] or 0)
+        return {**state, "events": events}
+
+
+board_log = BoardEventLog()
@@ -0,0 +1,126 @@
+from typing import AsyncIterator, Callable, List, Sequence, Tuple
+from app.core.config import settings
+from app.core.database import ReadSessionLocal
+import csv
+import io
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+
+def _gzip_compressor():
+    # wbits=31 输出带 gzip 头的流，可直接保存为 .gz 文件
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+async def stream_csv(
+    query,
+    header: List[str],
+    to_row: Callable[[Sequence], List],
+    gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """用服务端游标分批读取结果集，边查询边输出 CSV 字节块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = _gzip_compressor() if gzip else None
+
+    def drain() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        if compressor is not None:
+            data = compressor.compress(data)
+        return data
+
+    writer.writerow(header)
+    chunk = drain()
+    if chunk:
+        yield chunk
+
+    async with ReadSessionLocal() as session:
+        result = await session.stream(
+            query.execution_options(yield_per=settings.EXPORT_CHUNK_ROWS)
+        )
+        async for partition in result.partitions():
+            writer.writerows(to_row(row) for row in partition)
+            chunk = drain()
+            if chunk:
+                yield chunk
+
+    if compressor is not None:
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的输出缓冲，tell() 返回累计偏移，供 Parquet/Arrow 写 footer"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+async def stream_columnar(
+    query,
+    columns: List[Tuple[str, str]],
+    to_record: Callable[[Sequence], Tuple],
+    format: str = "parquet"
+) -> AsyncIterator[bytes]:
+    """按列批量写出 Parquet 或 Arrow IPC 文件，每批对应一次游标读取"""
+    schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+    sink = _ChunkSink()
+    stream = pa.PythonFile(sink, mode="w")
+    if format == "parquet":
+        writer = pq.ParquetWriter(stream, schema)
+    else:
+        writer = pa.ipc.new_file(stream, schema)
+
+    try:
+        async with ReadSessionLocal() as session:
+            result = await session.stream(
+                query.execution_options(yield_per=settings.EXPORT_CHUNK_ROWS)
+            )
+            async for partition in result.partitions():
+                records = [to_record(row) for row in partition]
+                arrays = [
+                    pa.array([record[i] for record in records], type=field.type)
+                    for i, field in enumerate(schema)
+                ]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    finally:
+        writer.close()
+
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
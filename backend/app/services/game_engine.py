@@ -0,0 +1,505 @@
+"""
+LMS-Edge Game Engine - 答题对战的内存状态
+
+比赛、玩家资料都放在内存字典里，按 match_id / user_id 直接取，
+不再每个请求读整个 JSON 文件、线性查找再整个写回。等待队列和
+"谁在哪场比赛里"交给 Matchmaker，配对和状态查询都是 O(1)。
+结构变化（建比赛、玩家资料）由引擎锁保护；同一场比赛的答题、
+心跳、退出由这场比赛自己的锁串行，不同比赛互不阻塞。
+加锁顺序固定为 比赛锁 -> 引擎锁 -> Matchmaker 锁，反过来不允许。
+
+持久化交给 store（SQLiteGameStore）：修改后最多 snapshot_interval 秒
+合并一次，只写变化过的玩家和比赛，进程崩溃重启后从库里恢复。
+等待匹配的队列只在内存里，重启后客户端重新匹配即可。
+结束超过 retention 秒的比赛从内存和 game_matches 挪到归档表。
+
+传入 events（GameEventHub）时，配对成功、对手答题、回合结算、比赛结束
+都会立即推给相关玩家，客户端不用轮询 /api/game/state。只依赖标准库。
+"""
+
+import copy
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.services.matchmaking import Matchmaker
+
+logger = logging.getLogger(__name__)
+
+MAX_HP = 100
+# 归档检查的最小间隔（秒）
+RETENTION_CHECK_INTERVAL = 60
+
+
+def _user_data(user_id, user):
+    return {'user_id': user_id, 'username': user['username'], 'full_name': user['full_name'] or user['username']}
+
+
+def _new_match(match_id, player1, player2, player1_data, player2_data, questions):
+    return {
+        'match_id': match_id,
+        'player1': player1,
+        'player2': player2,
+        'player1_data': player1_data,
+        'player2_data': player2_data,
+        'player1_hp': MAX_HP,
+        'player2_hp': MAX_HP,
+        'player1_answered': False,
+        'player2_answered': False,
+        'player1_answer': None,
+        'player2_answer': None,
+        'player1_correct': None,
+        'player2_correct': None,
+        'current_question_idx': 0,
+        'questions': questions,
+        'my_turn': 1,
+        'created_at': datetime.now().isoformat(),
+        'game_over': False,
+        'winner': None
+    }
+
+
+def _round_damage(p1_correct, p2_correct):
+    """双方都对不掉血；一对一错错的掉 20；都错各掉 10"""
+    if p1_correct and p2_correct:
+        return 0, 0
+    if p1_correct:
+        return 0, 20
+    if p2_correct:
+        return 20, 0
+    return 10, 10
+
+
+class GameEngine:
+    def __init__(self, store, questions, snapshot_interval=2.0, pending_ttl=60, opponent_timeout=90, retention=600,
+                 events=None):
+        self._store = store
+        self._events = events
+        self._questions = questions
+        self.snapshot_interval = snapshot_interval
+        self.pending_ttl = pending_ttl
+        self.opponent_timeout = opponent_timeout
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._dirty_players = set()
+        self._dirty_matches = set()
+        self._last_retention = 0
+
+        self.players, self.matches = store.load()
+        self._match_locks = {match_id: threading.Lock() for match_id in self.matches}
+        self.matchmaker = Matchmaker(pending_ttl)
+        for match_id, match in self.matches.items():
+            if not match['game_over']:
+                self.matchmaker.start_match(match_id, match['player1'], match['player2'])
+
+    def _arm(self):
+        """调用方持有 _lock"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.snapshot_interval, self.snapshot)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _player_changed(self, user_id):
+        """调用方持有 _lock"""
+        self._dirty_players.add(user_id)
+        self._arm()
+
+    def _match_changed(self, match_id):
+        with self._lock:
+            self._dirty_matches.add(match_id)
+            self._arm()
+
+    def _publish(self, user_id, event):
+        """推送事件，返回送达的连接数"""
+        return self._events.publish(user_id, event) if self._events is not None else 0
+
+    def _finish(self, match, winner, reason):
+        """结束比赛；调用方持有比赛锁"""
+        match['game_over'] = True
+        match['winner'] = winner
+        match['finished_at'] = datetime.now().isoformat()
+        match['finish_reason'] = reason
+        self.matchmaker.end_match(match['match_id'], match['player1'], match['player2'])
+        self._match_changed(match['match_id'])
+
+    def _announce_game_over(self, match):
+        """调用方持有比赛锁"""
+        for user_id in (match['player1'], match['player2']):
+            self._publish(user_id, {'type': 'game_over', 'match_id': match['match_id'],
+                                    'winner': match['winner'], 'reason': match['finish_reason']})
+
+    def _opponent_timed_out(self, match, user_id):
+        """对手最后一次心跳超过 opponent_timeout；对手还没发过心跳时不算，等它超时"""
+        is_p1 = match['player1'] == user_id
+        last_active = match.get('player2_last_active' if is_p1 else 'player1_last_active')
+        if not last_active:
+            return False
+        try:
+            idle = (datetime.now() - datetime.fromisoformat(last_active)).total_seconds()
+        except ValueError:
+            return False
+        return idle > self.opponent_timeout
+
+    def _get_match(self, match_id):
+        with self._lock:
+            return self.matches.get(match_id), self._match_locks.get(match_id)
+
+    # ---- 玩家资料 ----
+
+    def get_player(self, user_id, user):
+        """取玩家资料，第一次进游戏时创建"""
+        with self._lock:
+            player = self.players.get(user_id)
+            if player is None:
+                player = {
+                    **_user_data(user_id, user),
+                    'gold': 10,
+                    'medals': 0,
+                    'wins': 0,
+                    'inventory': [{'e': '🍎', 't': 'heal', 'name': '苹果'}]
+                }
+                self.players[user_id] = player
+                self._player_changed(user_id)
+            return dict(player)
+
+    def set_inventory(self, user_id, inventory):
+        with self._lock:
+            player = self.players.get(user_id)
+            if player is not None:
+                player['inventory'] = inventory
+                self._player_changed(user_id)
+
+    def _record_win(self, user_id):
+        """调用方持有 _lock"""
+        player = self.players.get(user_id)
+        if player is not None:
+            player['wins'] = player.get('wins', 0) + 1
+            player['medals'] = player.get('medals', 0) + 1
+            player['gold'] = player.get('gold', 10) + random.randint(10, 20)
+            self._player_changed(user_id)
+
+    def leaderboard(self, limit=20):
+        """先把变化写进库，再按 medals 索引取前几名"""
+        self.snapshot()
+        return self._store.leaderboard(limit)
+
+    # ---- 匹配 ----
+
+    def join(self, user_id, user):
+        """进入匹配；有人在等就立刻开一场，返回 (match, 对手资料)，否则排队返回 (None, None)
+
+        已经在比赛中的用户直接拿回那一场，不会被再配一次。
+        """
+        match = self.active_match(user_id)
+        if match is None:
+            # 题目可能要读文件，放在锁外面
+            questions = self._questions()
+            with self._lock:
+                # 同一用户的并发请求可能刚被配进一场，锁里再看一次
+                created = self.matchmaker.match_of(user_id) is None
+                if created:
+                    match = self._pair(user_id, user, questions)
+                    if match is None:
+                        logger.debug(f'[MATCH] User {user_id} added to pending')
+                        return None, None
+            if created:
+                self._announce_match(match)
+                return match, match['player1_data']
+            match = self.active_match(user_id)
+            if match is None:
+                return None, None
+        is_p1 = match['player1'] == user_id
+        return match, match['player2_data'] if is_p1 else match['player1_data']
+
+    def _pair(self, user_id, user, questions):
+        """从队列取对手开一场，没人在等时排队返回 None；调用方持有 _lock
+
+        出队和建比赛在同一把锁里，并发的请求不会抢到同一个对手。
+        """
+        opponent = self.matchmaker.join(user_id, _user_data(user_id, user))
+        if opponent is None:
+            return None
+        match_id = str(int(time.time())) + str(user_id)
+        match = _new_match(match_id, opponent.user_id, user_id,
+                           opponent.user_data, _user_data(user_id, user), questions)
+        self.matches[match_id] = match
+        self._match_locks[match_id] = threading.Lock()
+        self.matchmaker.start_match(match_id, opponent.user_id, user_id)
+        self._dirty_matches.add(match_id)
+        self._arm()
+        logger.debug(f"[MATCH] Match created: {match_id}, P1={opponent.user_id}, P2={user_id}")
+        return match
+
+    def _announce_match(self, match):
+        """双方都推一条，等待中的一方不用再轮询 /api/game/check"""
+        for is_player1, opponent_data in ((True, match['player2_data']), (False, match['player1_data'])):
+            self._publish(match['player1'] if is_player1 else match['player2'], {
+                'type': 'matched', 'match_id': match['match_id'], 'is_player1': is_player1,
+                'opponent': opponent_data, 'player1_id': match['player1']
+            })
+
+    def active_match(self, user_id):
+        """用户正在进行的比赛（副本），没有返回 None"""
+        match_id = self.matchmaker.match_of(user_id)
+        if match_id is None:
+            return None
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return None
+        with lock:
+            # 取到索引和拿到比赛锁之间比赛可能刚好结束
+            return None if match['game_over'] else copy.deepcopy(match)
+
+    def is_matching(self, user_id):
+        return self.matchmaker.is_waiting(user_id)
+
+    def statuses(self, user_ids):
+        """每个用户的 (状态, 勋章数)，状态为 matching / playing / offline"""
+        with self._lock:
+            medals = {user_id: self.players[user_id]['medals'] if user_id in self.players else 0
+                      for user_id in user_ids}
+        return {user_id: (self.matchmaker.status(user_id), medals[user_id]) for user_id in user_ids}
+
+    # ---- 对战 ----
+
+    def state(self, match_id, user_id):
+        """当前局面，比赛不存在返回 None"""
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return None
+        with lock:
+            if match['game_over']:
+                return {'success': True, 'game_over': True, 'winner': match['winner']}
+
+            is_p1 = match['player1'] == user_id
+            if self._opponent_timed_out(match, user_id):
+                self._finish(match, user_id, 'timeout')
+                self._announce_game_over(match)
+                return {'success': True, 'game_over': True, 'winner': user_id, 'timeout': True, 'opponent_left': True}
+
+            current_idx = match['current_question_idx']
+            current_q = None
+            if current_idx < len(match['questions']):
+                q = match['questions'][current_idx]
+                current_q = {'question': q['q'], 'options': q['options'], 'is_multi': q['is_multi']}
+
+            lrr = match.get('last_round_result')
+            if lrr and self._mark_processed(match, user_id):
+                # 上一回合结果每个玩家只返回一次，已经从答题响应或推送拿到的不再重复
+                return {
+                    'success': True,
+                    'game_over': False,
+                    'round_result': {
+                        'p1_correct': lrr['p1_correct'],
+                        'p2_correct': lrr['p2_correct'],
+                        'p1_dmg': lrr['p1_dmg'],
+                        'p2_dmg': lrr['p2_dmg'],
+                        'p1_hp': lrr['p1_hp'],
+                        'p2_hp': lrr['p2_hp']
+                    },
+                    'hp': lrr['p1_hp'] if is_p1 else lrr['p2_hp'],
+                    'opponent_hp': lrr['p2_hp'] if is_p1 else lrr['p1_hp'],
+                    'current_question': current_q,
+                    'current_question_idx': current_idx,
+                    'both_answered': True,  # 上一回合双方都答了
+                    'player_answered': True,  # 当前玩家已答上一题
+                    'total_questions': len(match['questions'])
+                }
+
+            return {
+                'success': True,
+                'game_over': False,
+                'opponent_left': False,
+                'hp': match['player1_hp'] if is_p1 else match['player2_hp'],
+                'opponent_hp': match['player2_hp'] if is_p1 else match['player1_hp'],
+                'current_question': current_q,
+                'current_question_idx': current_idx,
+                'both_answered': match['player1_answered'] and match['player2_answered'],
+                'player_answered': match['player1_answered'] if is_p1 else match['player2_answered'],
+                'total_questions': len(match['questions'])
+            }
+
+    def _mark_processed(self, match, user_id):
+        """记录玩家已经看过上一回合结果，之前没看过返回 True；调用方持有比赛锁"""
+        lrr = match['last_round_result']
+        processed_by = lrr.get('processed_by', [])
+        if not isinstance(processed_by, list):
+            processed_by = [processed_by] if processed_by else []
+        if user_id in processed_by:
+            return False
+        processed_by.append(user_id)
+        lrr['processed_by'] = processed_by
+        self._match_changed(match['match_id'])
+        return True
+
+    def round_delivered(self, match_id, user_id, question_idx):
+        """推送连接已把 question_idx 这一回合的结果写给 user_id；已经进入下一回合的不再标记"""
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return
+        with lock:
+            lrr = match.get('last_round_result')
+            if lrr and lrr.get('question_idx') == question_idx:
+                self._mark_processed(match, user_id)
+
+    def answer(self, match_id, user_id, answer):
+        """提交答案；双方都答完时结算这一回合，返回结果，比赛不存在或已结束返回 None"""
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return None
+        with lock:
+            if match['game_over']:
+                return None
+
+            # 后端自己判断答案对错
+            prefix = 'player1' if match['player1'] == user_id else 'player2'
+            correct_answer = match['questions'][match['current_question_idx']]['answer']
+            user_correct = sorted(answer.split(',')) == sorted(correct_answer.split(','))
+            match[f'{prefix}_answer'] = answer
+            match[f'{prefix}_correct'] = user_correct
+            match[f'{prefix}_answered'] = True
+            logger.debug(f'[GAME] Player {user_id} ({prefix}) answered {answer}, correct={user_correct}')
+
+            opponent_id = match['player2'] if prefix == 'player1' else match['player1']
+            round_result = None
+            if match['player1_answered'] and match['player2_answered']:
+                round_result = self._settle_round(match)
+                # 答题的一方从响应里拿结果；对手靠推送，放进队列不等于送到了，
+                # 推送连接真正写出去后调用 round_delivered 才算看过，否则下次拉 state 还能拿到
+                self._mark_processed(match, user_id)
+                self._publish(opponent_id, {'type': 'round_result', 'match_id': match_id, **round_result})
+                # 结束通知排在最后一回合结果之后
+                if match['game_over']:
+                    self._announce_game_over(match)
+            else:
+                self._publish(opponent_id, {'type': 'opponent_answered', 'match_id': match_id,
+                                            'question_idx': match['current_question_idx']})
+            self._match_changed(match_id)
+            return round_result or {}
+
+    def _settle_round(self, match):
+        """调用方持有比赛锁"""
+        p1_correct = match['player1_correct']
+        p2_correct = match['player2_correct']
+        dmg_p1, dmg_p2 = _round_damage(p1_correct, p2_correct)
+        match['player1_hp'] = max(0, match['player1_hp'] - dmg_p1)
+        match['player2_hp'] = max(0, match['player2_hp'] - dmg_p2)
+
+        round_result = {
+            'p1_correct': p1_correct,
+            'p2_correct': p2_correct,
+            'p1_dmg': dmg_p1,
+            'p2_dmg': dmg_p2,
+            'p1_hp': match['player1_hp'],
+            'p2_hp': match['player2_hp'],
+            'question_idx': match['current_question_idx']
+        }
+        # 记录回合结果供双方查看
+        match['last_round_result'] = {**round_result, 'processed_by': []}
+
+        for prefix in ('player1', 'player2'):
+            match[f'{prefix}_answered'] = False
+            match[f'{prefix}_answer'] = None
+            match[f'{prefix}_correct'] = None
+        match['current_question_idx'] += 1
+
+        if match['player1_hp'] <= 0 or match['player2_hp'] <= 0 or match['current_question_idx'] >= len(match['questions']):
+            if match['player1_hp'] > match['player2_hp']:
+                winner = match['player1']
+            elif match['player2_hp'] > match['player1_hp']:
+                winner = match['player2']
+            else:
+                winner = 'draw'
+            self._finish(match, winner, 'finished')
+            if match['winner'] != 'draw':
+                with self._lock:
+                    self._record_win(match['winner'])
+        return {'round_result': round_result}
+
+    def heartbeat(self, match_id, user_id):
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return False
+        with lock:
+            if match['game_over']:
+                return False
+            if match['player1'] == user_id:
+                match['player1_last_active'] = datetime.now().isoformat()
+            elif match['player2'] == user_id:
+                match['player2_last_active'] = datetime.now().isoformat()
+            # 客户端不再轮询 state，对手掉线由心跳发现
+            if self._opponent_timed_out(match, user_id):
+                self._finish(match, user_id, 'timeout')
+                self._announce_game_over(match)
+            self._match_changed(match_id)
+            return True
+
+    def quit(self, match_id, user_id):
+        """退出比赛，对手获胜"""
+        match, lock = self._get_match(match_id)
+        if match is None:
+            return False
+        with lock:
+            if match['game_over']:
+                return False
+            self._finish(match, match['player2'] if match['player1'] == user_id else match['player1'], 'quit')
+            self._announce_game_over(match)
+            with self._lock:
+                self._record_win(match['winner'])
+            return True
+
+    # ---- 持久化 ----
+
+    def snapshot(self):
+        """把变化过的玩家和比赛写进库；定时器、退出钩子都会调用，没有修改时什么也不做"""
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                player_ids, self._dirty_players = self._dirty_players, set()
+                match_ids, self._dirty_matches = self._dirty_matches, set()
+                players = [copy.deepcopy(self.players[i]) for i in player_ids if i in self.players]
+                entries = [(self.matches[i], self._match_locks[i]) for i in match_ids if i in self.matches]
+
+            # 每场比赛在自己的锁里复制，不持有引擎锁
+            matches = []
+            for match, lock in entries:
+                with lock:
+                    matches.append(copy.deepcopy(match))
+
+            if players or matches:
+                try:
+                    self._store.save(players, matches)
+                except Exception:
+                    logger.exception(f'Failed to save {len(players)} game players and {len(matches)} matches')
+                    with self._lock:
+                        self._dirty_players |= player_ids
+                        self._dirty_matches |= match_ids
+                        self._arm()
+                    return
+            self._retain()
+
+    def _retain(self):
+        """归档结束超过保留期的比赛；调用方持有 _write_lock"""
+        now = time.time()
+        if now - self._last_retention < RETENTION_CHECK_INTERVAL:
+            return
+        self._last_retention = now
+        cutoff = (datetime.now() - timedelta(seconds=self.retention)).isoformat()
+        try:
+            archived = self._store.archive_finished(cutoff)
+        except Exception:
+            logger.exception('Failed to archive finished game matches')
+            return
+        with self._lock:
+            for match_id in archived:
+                match = self.matches.get(match_id)
+                if match is not None and match['game_over'] and match_id not in self._dirty_matches:
+                    del self.matches[match_id]
+                    del self._match_locks[match_id]
+        if archived:
+            logger.info(f'Archived {len(archived)} finished game matches')
@@ -0,0 +1,74 @@
+"""
+LMS-Edge Game Events - 对战事件推送
+
+GameEngine 在状态变化时 publish 事件（matched / opponent_answered /
+round_result / game_over），每个订阅者一条有界队列，Flask 的
+/api/game/events 把队列转成 Server-Sent Events 推给浏览器，客户端不用再轮询。
+同一用户可以有多个订阅（多个标签页）。订阅者读得太慢队列满了就把它关掉，
+浏览器的 EventSource 会自动重连，重连后客户端拉一次完整状态补齐。
+只依赖标准库，线程安全。
+"""
+
+import queue
+import threading
+
+
+class Subscription:
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=size)
+        self.closed = False
+
+    def get(self, timeout):
+        """取下一条事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class GameEventHub:
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def is_connected(self, user_id):
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+    def publish(self, user_id, event):
+        """推给这个用户的所有订阅，返回送达的订阅数"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+                delivered += 1
+            except queue.Full:
+                self.dropped += 1
+                self.unsubscribe(subscription)
+                # 唤醒推送循环让它结束连接
+                try:
+                    subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+        return delivered
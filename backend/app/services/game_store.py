@@ -0,0 +1,225 @@
+"""
+LMS-Edge Game Store - 答题对战数据存到 lms.db
+
+game_players 以 user_id 为主键，medals 上有索引，排行榜直接按索引取前 N 名；
+game_matches 以 match_id 为主键，整场比赛的状态存成 JSON，
+另外冗余出 player1 / player2 / game_over / finished_at 几列用于查询。
+GameEngine 只把变化过的玩家和比赛按主键 upsert，一次快照一个事务。
+
+结束超过保留期的比赛由 archive_finished 挪到 game_matches_archive，
+只保留胜负和血量摘要，不再带题目，game_matches 只剩进行中和最近结束的比赛。
+import_json 把旧的 data/game/*.json 一次性导入。只依赖标准库。
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS game_players (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        gold INTEGER DEFAULT 10,
+        medals INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        inventory TEXT,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_game_players_medals ON game_players (medals DESC, user_id)',
+    '''CREATE TABLE IF NOT EXISTS game_matches (
+        match_id TEXT PRIMARY KEY,
+        player1 INTEGER,
+        player2 INTEGER,
+        game_over INTEGER DEFAULT 0,
+        winner INTEGER,
+        created_at TEXT,
+        finished_at TEXT,
+        state TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_game_matches_over_finished ON game_matches (game_over, finished_at)',
+    '''CREATE TABLE IF NOT EXISTS game_matches_archive (
+        match_id TEXT PRIMARY KEY,
+        player1 INTEGER,
+        player2 INTEGER,
+        winner INTEGER,
+        is_draw INTEGER DEFAULT 0,
+        player1_hp INTEGER,
+        player2_hp INTEGER,
+        rounds INTEGER,
+        created_at TEXT,
+        finished_at TEXT,
+        archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )''',
+]
+
+PLAYER_COLUMNS = ('user_id', 'username', 'full_name', 'gold', 'medals', 'wins', 'inventory')
+
+
+def _player_row(player):
+    return (
+        player['user_id'], player.get('username'), player.get('full_name'),
+        player.get('gold', 10), player.get('medals', 0), player.get('wins', 0),
+        json.dumps(player.get('inventory', []), ensure_ascii=False),
+    )
+
+
+def _match_row(match):
+    winner = match.get('winner')
+    return (
+        match['match_id'], match['player1'], match['player2'], 1 if match['game_over'] else 0,
+        winner if isinstance(winner, int) else None,
+        match.get('created_at'), match.get('finished_at'),
+        json.dumps(match, ensure_ascii=False),
+    )
+
+
+def _player_from_row(row):
+    player = dict(zip(PLAYER_COLUMNS, row))
+    player['inventory'] = json.loads(player['inventory'] or '[]')
+    return player
+
+
+class SQLiteGameStore:
+    def __init__(self, connect):
+        self._connect = connect
+
+    def create_tables(self):
+        conn = self._connect()
+        try:
+            for sql in SCHEMA:
+                conn.execute(sql)
+        finally:
+            conn.close()
+
+    def load(self):
+        """启动时读出全部玩家和没归档的比赛"""
+        self.create_tables()
+        conn = self._connect()
+        try:
+            players = {row[0]: _player_from_row(row) for row in
+                       conn.execute(f'SELECT {", ".join(PLAYER_COLUMNS)} FROM game_players')}
+            matches = {}
+            for (state,) in conn.execute('SELECT state FROM game_matches'):
+                match = json.loads(state)
+                matches[match['match_id']] = match
+        finally:
+            conn.close()
+        return players, matches
+
+    def save(self, players, matches):
+        """在一个事务里 upsert 变化过的玩家和比赛"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            conn.executemany(
+                f'INSERT OR REPLACE INTO game_players ({", ".join(PLAYER_COLUMNS)}, updated_at) '
+                f'VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
+                [_player_row(p) for p in players])
+            conn.executemany(
+                'INSERT OR REPLACE INTO game_matches '
+                '(match_id, player1, player2, game_over, winner, created_at, finished_at, state) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [_match_row(m) for m in matches])
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def leaderboard(self, limit=20):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'SELECT {", ".join(PLAYER_COLUMNS)} FROM game_players '
+                                f'ORDER BY medals DESC, user_id LIMIT ?', (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [_player_from_row(row) for row in rows]
+
+    def archive_finished(self, finished_before):
+        """把 finished_before 之前结束的比赛挪到归档表，返回挪走的 match_id"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            rows = conn.execute('SELECT match_id, state FROM game_matches WHERE game_over = 1 AND finished_at < ?',
+                                (finished_before,)).fetchall()
+            archived = []
+            for match_id, state in rows:
+                match = json.loads(state)
+                winner = match.get('winner')
+                archived.append((
+                    match_id, match['player1'], match['player2'],
+                    winner if isinstance(winner, int) else None, 1 if winner == 'draw' else 0,
+                    match.get('player1_hp'), match.get('player2_hp'), match.get('current_question_idx'),
+                    match.get('created_at'), match.get('finished_at'),
+                ))
+            conn.executemany(
+                'INSERT OR REPLACE INTO game_matches_archive '
+                '(match_id, player1, player2, winner, is_draw, player1_hp, player2_hp, rounds, created_at, finished_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', archived)
+            conn.executemany('DELETE FROM game_matches WHERE match_id = ?', [(row[0],) for row in archived])
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return [row[0] for row in archived]
+
+    def import_json(self, game_dir, rename=True):
+        """导入旧的 players.json / matches.json，已存在的记录不覆盖；返回 (玩家数, 比赛数)
+
+        导入成功后把文件改名为 *.imported，下次启动不会重复导入。
+        """
+        self.create_tables()
+        paths = [os.path.join(game_dir, name) for name in ('players.json', 'matches.json')]
+        players, matches = (_read_list(path) for path in paths)
+        for match in matches:
+            # 旧数据没有结束时间，按创建时间算，导入后很快会被归档
+            if match.get('game_over') and not match.get('finished_at'):
+                match['finished_at'] = match.get('created_at')
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            before = conn.total_changes
+            conn.executemany(
+                f'INSERT OR IGNORE INTO game_players ({", ".join(PLAYER_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [_player_row(p) for p in players if 'user_id' in p])
+            imported_players = conn.total_changes - before
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO game_matches '
+                '(match_id, player1, player2, game_over, winner, created_at, finished_at, state) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [_match_row(m) for m in matches if 'match_id' in m])
+            imported_matches = conn.total_changes - before
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        if rename:
+            for path in paths:
+                if os.path.exists(path):
+                    os.replace(path, f'{path}.imported')
+        return imported_players, imported_matches
+
+
+def _read_list(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        logger.exception(f'Failed to read {path}')
+        return []
+    return data if isinstance(data, list) else []
@@ -0,0 +1,104 @@
+"""
+LMS-Edge Last Active Buffer - users / attendances 的 last_active 写回缓冲
+
+心跳只改内存：同一用户、同一条考勤记录在一个周期内的多次刷新合并成一个值，
+每 flush_interval 秒在一个事务里批量写入，代替每次心跳两条自动提交的 UPDATE。
+读取 last_active 时先看缓冲区，再看正在写入、还没提交的那一批，保证拿到的是最新值。
+只依赖标准库，线程安全。
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LastActiveBuffer:
+    def __init__(self, connect, flush_interval=5.0):
+        self._connect = connect
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._users = {}
+        self._attendances = {}
+        # 正在 flush 的用户值，提交成功前读取仍以它为准
+        self._inflight = {}
+        # 用户当前未结束的考勤记录，心跳时不用每次查询
+        self._open_attendance = {}
+
+    def touch(self, user_id, when, attendance_id=None):
+        with self._lock:
+            self._users[user_id] = when
+            if attendance_id is not None:
+                self._attendances[attendance_id] = when
+            self._arm()
+
+    def _arm(self):
+        """调用方持有 _lock"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def open_attendance(self, user_id):
+        with self._lock:
+            return self._open_attendance.get(user_id)
+
+    def remember_attendance(self, user_id, attendance_id):
+        with self._lock:
+            self._open_attendance[user_id] = attendance_id
+
+    def forget(self, user_id):
+        with self._lock:
+            self._open_attendance.pop(user_id, None)
+
+    def last_active(self, user_id):
+        with self._lock:
+            when = self._users.get(user_id)
+            return when if when is not None else self._inflight.get(user_id)
+
+    def overlay(self, row):
+        """把缓冲区里更新的 last_active 盖到查询结果上"""
+        row = dict(row)
+        pending = self.last_active(row.get('id'))
+        if pending is not None:
+            row['last_active'] = pending
+        return row
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                users, self._users = self._users, {}
+                attendances, self._attendances = self._attendances, {}
+                self._inflight = users
+            if not users and not attendances:
+                return
+
+            conn = None
+            try:
+                conn = self._connect()
+                conn.execute('BEGIN')
+                conn.executemany('UPDATE users SET last_active = ? WHERE id = ?',
+                                 [(when, user_id) for user_id, when in users.items()])
+                conn.executemany('UPDATE attendances SET last_active = ? WHERE id = ?',
+                                 [(when, attendance_id) for attendance_id, when in attendances.items()])
+                conn.execute('COMMIT')
+                with self._lock:
+                    self._inflight = {}
+            except Exception:
+                logger.exception(f'Failed to flush last_active for {len(users)} users')
+                if conn is not None and conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                # 放回缓冲区，期间有更新的以新值为准
+                with self._lock:
+                    self._inflight = {}
+                    for user_id, when in users.items():
+                        self._users.setdefault(user_id, when)
+                    for attendance_id, when in attendances.items():
+                        self._attendances.setdefault(attendance_id, when)
+                    self._arm()
+            finally:
+                if conn is not None:
+                    conn.close()
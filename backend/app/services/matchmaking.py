@@ -0,0 +1,140 @@
+"""
+LMS-Edge Matchmaking - 对战匹配队列
+
+等待的玩家按先来后到排在一个 FIFO 队列里，user_id -> 票据的索引让
+"是否在等待"、取消、刷新都是 O(1)；过期时间放在最小堆里，每次操作只弹出
+已经到期的票据，不再每个请求过滤整张等待表。离开队列的票据只打标记，
+轮到它时再丢掉（惰性删除），配对摊还 O(1)。
+另有 user_id -> match_id 的索引，查某个用户是否在对战中也是 O(1)。
+所有操作在同一把锁里完成，并发加入不会把同一个人配给两场比赛。
+只依赖标准库。
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+
+class Ticket:
+    __slots__ = ('user_id', 'user_data', 'expires', 'active')
+
+    def __init__(self, user_id, user_data, expires):
+        self.user_id = user_id
+        self.user_data = user_data
+        self.expires = expires
+        self.active = True
+
+
+class Matchmaker:
+    def __init__(self, ttl=60, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._tickets = {}
+        self._expiry = []
+        self._counter = itertools.count()
+        self._matches = {}
+
+    def _expire(self, now):
+        """弹出到期的票据；调用方持有 _lock"""
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, _, ticket = heapq.heappop(self._expiry)
+            # 刷新过的票据在堆里留有旧条目，过期时间对不上的跳过
+            if ticket.active and ticket.expires == expires:
+                self._drop(ticket)
+
+    def _drop(self, ticket):
+        """调用方持有 _lock"""
+        ticket.active = False
+        if self._tickets.get(ticket.user_id) is ticket:
+            del self._tickets[ticket.user_id]
+
+    def _pop_opponent(self, user_id):
+        """取队首第一个不是自己的有效票据；调用方持有 _lock"""
+        own = None
+        opponent = None
+        while self._queue:
+            ticket = self._queue.popleft()
+            if not ticket.active:
+                continue
+            if ticket.user_id == user_id:
+                own = ticket
+                continue
+            opponent = ticket
+            break
+        if own is not None:
+            self._queue.appendleft(own)
+        return opponent
+
+    def join(self, user_id, user_data):
+        """加入匹配；队列里有别人时取出并返回他的票据，否则排队（已在队列里则刷新过期时间）返回 None"""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            opponent = self._pop_opponent(user_id)
+            if opponent is not None:
+                self._drop(opponent)
+                ticket = self._tickets.get(user_id)
+                if ticket is not None:
+                    self._drop(ticket)
+                return opponent
+
+            ticket = self._tickets.get(user_id)
+            if ticket is None:
+                ticket = Ticket(user_id, user_data, now + self.ttl)
+                self._tickets[user_id] = ticket
+                self._queue.append(ticket)
+            else:
+                ticket.user_data = user_data
+                ticket.expires = now + self.ttl
+            heapq.heappush(self._expiry, (ticket.expires, next(self._counter), ticket))
+            return None
+
+    def cancel(self, user_id):
+        with self._lock:
+            ticket = self._tickets.get(user_id)
+            if ticket is None:
+                return False
+            self._drop(ticket)
+            return True
+
+    def is_waiting(self, user_id):
+        with self._lock:
+            self._expire(self._clock())
+            return user_id in self._tickets
+
+    def waiting_count(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._tickets)
+
+    def start_match(self, match_id, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._matches[user_id] = match_id
+                ticket = self._tickets.get(user_id)
+                if ticket is not None:
+                    self._drop(ticket)
+
+    def end_match(self, match_id, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                if self._matches.get(user_id) == match_id:
+                    del self._matches[user_id]
+
+    def match_of(self, user_id):
+        with self._lock:
+            return self._matches.get(user_id)
+
+    def status(self, user_id):
+        """matching / playing / offline"""
+        with self._lock:
+            self._expire(self._clock())
+            if user_id in self._tickets:
+                return 'matching'
+            if user_id in self._matches:
+                return 'playing'
+            return 'offline'
@@ -0,0 +1,105 @@
+"""
+LMS-Edge Presence - 在线状态服务，Flask 和 FastAPI 共用
+
+刷新 O(1)：用户按过期时刻挂到时间轮的一个槽上，再次刷新时从旧槽摘下挂到新槽。
+过期分摊：每次访问只推进自上次以来走过的槽，每个用户最多被检查一次，
+不再每个请求扫描整张在线表、解析时间字符串或查数据库。
+只依赖标准库，线程安全。
+"""
+
+import math
+import threading
+import time
+from datetime import datetime
+
+
+class PresenceService:
+    def __init__(self, timeout, resolution=1.0, clock=time.monotonic):
+        self.timeout = timeout
+        self.resolution = resolution
+        self._clock = clock
+        # 槽数覆盖一个完整的超时周期，新挂上的用户不会落到还没处理的槽里
+        self._span = int(math.ceil(timeout / resolution)) + 1
+        self._wheel = [set() for _ in range(self._span)]
+        self._deadline = {}
+        self._seen = {}
+        self._info = {}
+        self._lock = threading.Lock()
+        self._tick = self._now_tick()
+
+    def _now_tick(self):
+        return int(self._clock() / self.resolution)
+
+    def _advance(self):
+        """处理走过的槽，返回过期的用户；调用方持有 _lock"""
+        now = self._now_tick()
+        if now <= self._tick:
+            return []
+        expired = []
+        for tick in range(self._tick + 1, self._tick + 1 + min(now - self._tick, self._span)):
+            bucket = self._wheel[tick % self._span]
+            due = [user_id for user_id in bucket if self._deadline[user_id] <= now]
+            for user_id in due:
+                bucket.discard(user_id)
+                self._forget(user_id)
+                expired.append(user_id)
+        self._tick = now
+        return expired
+
+    def _forget(self, user_id):
+        del self._deadline[user_id]
+        self._seen.pop(user_id, None)
+        self._info.pop(user_id, None)
+
+    def touch(self, user_id, info=None):
+        """刷新在线时间，返回这个用户是否刚上线"""
+        with self._lock:
+            self._advance()
+            joined = user_id not in self._deadline
+            if not joined:
+                self._wheel[self._deadline[user_id] % self._span].discard(user_id)
+            deadline = self._tick + self._span - 1
+            self._deadline[user_id] = deadline
+            self._wheel[deadline % self._span].add(user_id)
+            self._seen[user_id] = time.time()
+            if info is not None:
+                self._info[user_id] = info
+            return joined
+
+    def remove(self, user_id):
+        with self._lock:
+            if user_id not in self._deadline:
+                return False
+            self._wheel[self._deadline[user_id] % self._span].discard(user_id)
+            self._forget(user_id)
+            return True
+
+    def expire(self):
+        with self._lock:
+            return self._advance()
+
+    def is_online(self, user_id):
+        with self._lock:
+            self._advance()
+            return user_id in self._deadline
+
+    def count(self):
+        with self._lock:
+            self._advance()
+            return len(self._deadline)
+
+    def last_seen(self, user_id):
+        with self._lock:
+            seen = self._seen.get(user_id)
+        return datetime.fromtimestamp(seen) if seen is not None else None
+
+    def online(self):
+        """在线用户列表，最近活跃的在前"""
+        with self._lock:
+            self._advance()
+            entries = [
+                {**self._info.get(user_id, {}), 'user_id': user_id,
+                 'last_active': datetime.fromtimestamp(seen).isoformat()}
+                for user_id, seen in sorted(self._seen.items(), key=lambda item: item[1], reverse=True)
+            ]
+        return entries
@@ -0,0 +1,147 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, delete, case
+from sqlalchemy.dialects.sqlite import insert
+from typing import Optional
+from datetime import datetime
+from app.models.user import User
+from app.models.attendance import Attendance
+from app.models.submission import Submission
+from app.models.user_stats import UserStatsRollup
+from app.schemas.stats import UserStats
+
+COUNTER_COLUMNS = (
+    "total_sessions",
+    "total_duration",
+    "activity_sum",
+    "total_submissions",
+    "correct_count",
+    "late_count",
+)
+
+
+async def bump_user_stats(db: AsyncSession, user_id: int, **deltas):
+    """在调用方的事务里累加统计计数，随业务写入一起提交"""
+    values = {column: deltas.get(column, 0) for column in COUNTER_COLUMNS}
+    now = datetime.utcnow()
+    stmt = insert(UserStatsRollup).values(user_id=user_id, updated_at=now, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStatsRollup.user_id],
+        set_={
+            **{
+                column: getattr(UserStatsRollup, column) + stmt.excluded[column]
+                for column in COUNTER_COLUMNS
+                if deltas.get(column)
+            },
+            "updated_at": now,
+        }
+    )
+    await db.execute(stmt)
+
+
+async def unbump_submissions(db: AsyncSession, *criteria):
+    """删除提交之前调用：按用户汇总将要删除的提交，在同一事务里从统计里减掉"""
+    rows = await db.execute(
+        select(
+            Submission.user_id,
+            func.count(Submission.id),
+            func.coalesce(func.sum(case((Submission.is_correct == 1, 1), else_=0)), 0)
+        )
+        .where(*criteria)
+        .group_by(Submission.user_id)
+    )
+    for user_id, submissions, correct in rows.all():
+        await bump_user_stats(db, user_id, total_submissions=-submissions, correct_count=-correct)
+
+
+async def delete_user_stats(db: AsyncSession, user_id: int):
+    """删除用户时连同统计行一起删掉，随调用方的事务提交"""
+    await db.execute(delete(UserStatsRollup).where(UserStatsRollup.user_id == user_id))
+
+
+async def read_user_stats(db: AsyncSession, user_id: int) -> Optional[UserStats]:
+    result = await db.execute(
+        select(User.username, UserStatsRollup)
+        .outerjoin(UserStatsRollup, UserStatsRollup.user_id == User.id)
+        .where(User.id == user_id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    username, rollup = row
+    if rollup is None:
+        return UserStats(
+            user_id=user_id,
+            username=username,
+            total_sessions=0,
+            total_duration=0,
+            avg_activity_score=0.0,
+            total_assignments=0,
+            correct_rate=0.0,
+            late_count=0
+        )
+
+    avg_activity = (rollup.activity_sum / rollup.total_sessions) if rollup.total_sessions > 0 else 0.0
+    correct_rate = (rollup.correct_count / rollup.total_submissions * 100) if rollup.total_submissions > 0 else 0.0
+    return UserStats(
+        user_id=user_id,
+        username=username,
+        total_sessions=rollup.total_sessions,
+        total_duration=rollup.total_duration,
+        avg_activity_score=float(avg_activity),
+        total_assignments=rollup.total_submissions,
+        correct_rate=correct_rate,
+        late_count=rollup.late_count
+    )
+
+
+async def rebuild_user_stats(db: AsyncSession) -> int:
+    """从 attendances 和 submissions 全量重建 user_stats，用于回填旧数据库"""
+    attendance_rows = await db.execute(
+        select(
+            Attendance.user_id,
+            func.count(Attendance.id),
+            func.coalesce(func.sum(Attendance.session_duration), 0),
+            func.coalesce(func.sum(Attendance.activity_score), 0.0),
+            func.coalesce(func.sum(case((Attendance.is_late == 1, 1), else_=0)), 0)
+        )
+        .group_by(Attendance.user_id)
+    )
+    submission_rows = await db.execute(
+        select(
+            Submission.user_id,
+            func.count(Submission.id),
+            func.coalesce(func.sum(case((Submission.is_correct == 1, 1), else_=0)), 0)
+        )
+        .group_by(Submission.user_id)
+    )
+
+    rollups = {}
+    for user_id, sessions, duration, activity, late in attendance_rows:
+        rollups[user_id] = {
+            "total_sessions": sessions,
+            "total_duration": duration,
+            "activity_sum": float(activity),
+            "late_count": late,
+        }
+    for user_id, submissions, correct in submission_rows:
+        rollup = rollups.setdefault(user_id, {})
+        rollup["total_submissions"] = submissions
+        rollup["correct_count"] = correct
+
+    now = datetime.utcnow()
+    await db.execute(delete(UserStatsRollup))
+    if rollups:
+        await db.execute(
+            insert(UserStatsRollup),
+            [
+                {
+                    "user_id": user_id,
+                    "updated_at": now,
+                    **{column: rollup.get(column, 0) for column in COUNTER_COLUMNS}
+                }
+                for user_id, rollup in rollups.items()
+            ]
+        )
+    await db.commit()
+    return len(rollups)
@@ -0,0 +1,201 @@
+"""
+LMS-Edge Whiteboard Store - Flask 白板的内存状态
+
+内存中的状态是权威数据，whiteboard.json 只是持久化副本：修改后最多
+flush_delay 秒合并写一次盘（临时文件 + rename，写到一半断电也不会损坏）。
+每次可见变化递增版本号，GET 用它做 ETag，客户端轮询没有变化时直接 304。
+心跳只在在线人数变化时才算可见变化，单纯刷新时间戳不会让 ETag 失效。
+在线状态由 PresenceService 维护，重启后等客户端下一次心跳重新上线。
+
+白板内容另有一个游标 seq：每条笔画、每次只改 content 的保存、每次清空
+都占一个序号，笔画本身带上 seq。客户端带着 since 轮询时只拿之后的笔画，
+清空过或者需要的笔画已经被截掉时返回 reset 和完整内容。
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from app.services.presence import PresenceService
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_state():
+    return {
+        'drawings': [], 'content': '', 'allowed': False, 'online': {}, 'online_count': 0,
+        'seq': 0, 'content_seq': 0, 'cleared_seq': 0,
+    }
+
+
+class WhiteboardStore:
+    def __init__(self, path, flush_delay=1.0, online_timeout=30, max_drawings=500):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.max_drawings = max_drawings
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+        # 重启后版本号从 0 开始，ETag 带上启动标识，避免旧 ETag 误命中
+        self._boot = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._rendered = None
+        self._presence = PresenceService(online_timeout)
+
+        self.state = self._load()
+
+    def _load(self):
+        state = _empty_state()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    state.update(json.load(f))
+            except (OSError, ValueError):
+                logger.exception(f'Failed to load {self.path}, starting with an empty whiteboard')
+        if not state['seq']:
+            # 旧文件里的笔画没有序号，按顺序补上
+            for seq, drawing in enumerate(state['drawings'], start=1):
+                drawing['seq'] = seq
+            state['seq'] = state['content_seq'] = len(state['drawings'])
+        return state
+
+    def _changed(self):
+        """调用方持有 _lock"""
+        self._version += 1
+        self._rendered = None
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _touch_online(self, user_id):
+        """刷新在线状态，返回在线人数是否变化"""
+        # 先取过期的，touch 内部也会推进时间轮，顺序反了会漏掉
+        expired = self._presence.expire()
+        joined = user_id is not None and self._presence.touch(str(user_id))
+        return bool(expired) or joined
+
+    def render(self):
+        """返回 (etag, JSON 字节)；同一版本只序列化一次"""
+        with self._lock:
+            if self._presence.expire():
+                self._changed()
+            if self._rendered is None:
+                body = {
+                    'seq': self.state['seq'],
+                    'drawings': self.state.get('drawings', []),
+                    'content': self.state.get('content', ''),
+                    'allowed': self.state.get('allowed', False),
+                    'online_count': self._presence.count(),
+                    'updated_at': self.state.get('updated_at'),
+                }
+                self._rendered = (f'{self._boot}-{self._version}', json.dumps(body).encode())
+            return self._rendered
+
+    def changes_since(self, since):
+        """since 之后的增量；没有变化时只有几个字段"""
+        with self._lock:
+            if self._presence.expire():
+                self._changed()
+            state = self.state
+            drawings = state['drawings']
+            oldest = drawings[0]['seq'] if drawings else state['seq'] + 1
+            reset = since > state['seq'] or state['cleared_seq'] > since or oldest > since + 1
+            if reset:
+                new_drawings = list(drawings)
+            else:
+                start = len(drawings)
+                while start > 0 and drawings[start - 1]['seq'] > since:
+                    start -= 1
+                new_drawings = drawings[start:]
+
+            body = {
+                'seq': state['seq'],
+                'reset': reset,
+                'drawings': new_drawings,
+                'allowed': state.get('allowed', False),
+                'online_count': self._presence.count(),
+            }
+            if reset or state['content_seq'] > since:
+                body['content'] = state.get('content', '')
+                body['updated_at'] = state.get('updated_at')
+            return body
+
+    @property
+    def allowed(self):
+        return self.state.get('allowed', False)
+
+    def save(self, user_id, content, drawings):
+        with self._lock:
+            seq = self.state['seq']
+            for drawing in drawings:
+                seq += 1
+                drawing['seq'] = seq
+            if drawings:
+                self.state['drawings'] = (self.state['drawings'] + drawings)[-self.max_drawings:]
+            if content != self.state.get('content'):
+                if not drawings:
+                    seq += 1
+                self.state['content'] = content
+                self.state['content_seq'] = seq
+            self.state['seq'] = seq
+            self.state['updated_at'] = datetime.now().isoformat()
+            self._touch_online(user_id)
+            self._changed()
+
+    def heartbeat(self, user_id):
+        with self._lock:
+            if self._touch_online(user_id):
+                self._changed()
+            return self._presence.count()
+
+    def set_allowed(self, allowed):
+        with self._lock:
+            self.state['allowed'] = allowed
+            self.state['updated_at'] = datetime.now().isoformat()
+            self._changed()
+
+    def clear(self):
+        with self._lock:
+            seq = self.state['seq'] + 1
+            self.state = {
+                **_empty_state(),
+                'seq': seq,
+                'content_seq': seq,
+                'cleared_seq': seq,
+                'updated_at': datetime.now().isoformat(),
+            }
+            self._presence = PresenceService(self._presence.timeout)
+            self._changed()
+
+    def flush(self):
+        """把当前状态写盘；定时器、退出钩子都会调用，没有修改时什么也不做"""
+        # 先拿写锁再取快照，保证后取的快照不会被先取的覆盖
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                state = dict(self.state)
+                state['online'] = {entry['user_id']: entry['last_active'] for entry in self._presence.online()}
+                state['online_count'] = len(state['online'])
+                data = json.dumps(state)
+
+            tmp_path = f'{self.path}.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                logger.exception(f'Failed to write {self.path}')
+                with self._lock:
+                    self._dirty = True
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from sqlalchemy import select
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal
 from app.core.security import decode_access_token
-from app.websocket import manager
+from app.websocket.manager import manager
+from app.websocket.protocol import InvalidMessage, decode, receive_payload
 from app.models.user import User
+from app.services.board_log import board_log
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +18,7 @@ async def websocket_endpoint(
     websocket: WebSocket,
     token: str = Query(...),
     board_id: str = Query(None),
-    db: AsyncSession = Depends(get_db)
+    since: int = Query(None)
 ):
     payload = decode_access_token(token)
     if not payload:
@@ -27,25 +27,41 @@ async def websocket_endpoint(
     
     user_id = payload.get("user_id")
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    # 连接池有上限，会话只在握手阶段短暂使用，不能跟着长连接一直占着；
+    # load_sync_state 内部还会另开会话，所以查完用户先把这个会话关掉
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
     if not user:
         await websocket.close(code=4002, reason="User not found")
         return
     
-    await manager.connect(websocket, user_id, board_id)
+    # 带 board_id 连接时先下发白板状态；since 是客户端已经拿到的最后一个序号
+    initial = None
+    if board_id:
+        async with AsyncSessionLocal() as db:
+            state = await board_log.load_sync_state(db, board_id, since)
+        initial = lambda: [{"type": "board_state", "data": board_log.top_up(state)}]
+    
+    connection = await manager.connect(websocket, user_id, board_id, {
+        "username": user.username,
+        "role": user.role.value
+    }, initial)
     
     try:
         while True:
-            data = await websocket.receive_text()
+            data = await receive_payload(websocket)
             try:
-                message = json.loads(data)
+                message = decode(connection.protocol, data)
                 
                 message_type = message.get("type")
                 message_data = message.get("data", {})
                 
                 if message_type == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    await manager.send_to(connection, {"type": "pong"})
+                
+                elif message_type == "presence_sync":
+                    await manager.send_presence(connection, message_data.get("version"))
                 
                 elif message_type == "activity_update":
                     activity_data = {
@@ -60,6 +76,7 @@ async def websocket_endpoint(
                     if board_id:
                         draw_data = {
                             "board_id": board_id,
+                            "user_id": user_id,
                             "action": message_data.get("action"),
                             "x": message_data.get("x"),
                             "y": message_data.get("y"),
@@ -67,10 +84,10 @@ async def websocket_endpoint(
                             "size": message_data.get("size"),
                             "points": message_data.get("points")
                         }
-                        await manager.broadcast_to_board(board_id, {
-                            "type": "draw",
-                            "data": draw_data
-                        })
+                        draw_data["seq"] = await board_log.append(
+                            board_id, draw_data["action"] or "draw", draw_data, user_id
+                        )
+                        manager.queue_draw(board_id, draw_data)
                 
                 elif message_type == "board_message":
                     if board_id:
@@ -87,20 +104,25 @@ async def websocket_endpoint(
                 
                 elif message_type == "board_clear":
                     if board_id:
+                        seq = await board_log.append(board_id, "clear", {}, user_id)
+                        # 先把清屏前的笔画发出去，保证顺序
+                        manager.draw_batcher.flush(board_id)
                         await manager.broadcast_to_board(board_id, {
-                            "type": "clear"
+                            "type": "clear",
+                            "seq": seq
                         })
                 
-            except json.JSONDecodeError:
-                logger.error(f"Invalid JSON received from user {user_id}")
-                await websocket.send_json({"type": "error", "message": "Invalid JSON"})
+            except InvalidMessage:
+                invalid = "Invalid MessagePack" if connection.binary else "Invalid JSON"
+                logger.error(f"{invalid} received from user {user_id}")
+                await manager.send_to(connection, {"type": "error", "message": invalid})
             except Exception as e:
                 logger.error(f"Error processing message from user {user_id}: {e}")
-                await websocket.send_json({"type": "error", "message": str(e)})
+                await manager.send_to(connection, {"type": "error", "message": str(e)})
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id, board_id)
+        manager.disconnect(user_id, board_id, connection)
         logger.info(f"WebSocket disconnected for user {user_id}")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
-        manager.disconnect(user_id, board_id)
+        manager.disconnect(user_id, board_id, connection)
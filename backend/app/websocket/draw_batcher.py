@@ -0,0 +1,116 @@
+from typing import Callable, Dict, List, Optional
+import asyncio
+import math
+
+# 每种路径命令携带的坐标个数（fabric.js 的 path 数组格式）
+COMMAND_ARITY = {"M": 2, "L": 2, "T": 2, "Q": 4, "S": 4, "C": 6, "Z": 0}
+
+
+def _end_point(coords: List[float]):
+    return (coords[-2], coords[-1]) if len(coords) >= 2 else None
+
+
+def _too_close(a, b, min_distance: float) -> bool:
+    return a is not None and b is not None and math.hypot(a[0] - b[0], a[1] - b[1]) < min_distance
+
+
+def compact_points(points: list, min_distance: float) -> Optional[dict]:
+    """
+    压缩一笔的点列：坐标取整，丢掉与上一个保留点重合或不足 min_distance 的点，
+    再按轴做差分编码。返回 {"c": 命令字母串, "d": 差分坐标}，纯 [x, y] 点列没有 "c"。
+    无法识别的格式返回 None，由调用方原样转发。
+    """
+    commands = []
+    for point in points:
+        if isinstance(point, (list, tuple)) and point and isinstance(point[0], str):
+            command = point[0].upper()
+            if command not in COMMAND_ARITY or len(point) - 1 != COMMAND_ARITY[command]:
+                return None
+            commands.append((command, point[1:]))
+        elif isinstance(point, (list, tuple)) and len(point) == 2:
+            commands.append((None, point))
+        else:
+            return None
+    if not commands:
+        return None
+
+    try:
+        commands = [(command, [int(round(v)) for v in coords]) for command, coords in commands]
+    except (TypeError, ValueError):
+        return None
+
+    kept = [commands[0]]
+    for index, (command, coords) in enumerate(commands[1:], start=1):
+        is_last = index == len(commands) - 1
+        if command in ("M", "Z") or is_last:
+            # 起笔、闭合和最后一个点决定笔画形状，始终保留
+            if is_last and kept[-1] == (command, coords):
+                continue
+            kept.append((command, coords))
+            continue
+        if _too_close(_end_point(coords), _end_point(kept[-1][1]), min_distance):
+            continue
+        kept.append((command, coords))
+
+    deltas = []
+    last = [0, 0]
+    for _, coords in kept:
+        for i, value in enumerate(coords):
+            deltas.append(value - last[i % 2])
+            last[i % 2] = value
+
+    encoded = {"d": deltas}
+    if kept[0][0] is not None:
+        encoded["c"] = "".join(command for command, _ in kept)
+    return encoded
+
+
+class DrawBatcher:
+    """按白板聚合绘制事件，每个 tick 只广播一帧 draw_batch"""
+
+    def __init__(self, broadcast: Callable[[str, dict], None], tick: float, min_distance: float):
+        self._broadcast = broadcast
+        self.tick = tick
+        self.min_distance = min_distance
+        self._pending: Dict[str, List[dict]] = {}
+        self._handles: Dict[str, asyncio.TimerHandle] = {}
+
+    def add(self, board_id: str, event: dict):
+        pending = self._pending.setdefault(board_id, [])
+
+        points = event.get("points")
+        if points:
+            encoded = compact_points(points, self.min_distance)
+            if encoded is not None:
+                event = {**event, "points": encoded, "encoding": "delta"}
+        elif pending and self._is_duplicate(pending[-1], event):
+            # 同一用户连续的指针事件没有移动超过阈值，直接丢掉
+            return
+
+        pending.append(event)
+        if board_id not in self._handles:
+            self._handles[board_id] = asyncio.get_running_loop().call_later(
+                self.tick, self.flush, board_id
+            )
+
+    def _is_duplicate(self, previous: dict, event: dict) -> bool:
+        if previous.get("points") or previous.get("user_id") != event.get("user_id"):
+            return False
+        if previous.get("action") != event.get("action"):
+            return False
+        if None in (event.get("x"), event.get("y"), previous.get("x"), previous.get("y")):
+            return previous == event
+        return _too_close(
+            (previous.get("x"), previous.get("y")), (event["x"], event["y"]), self.min_distance
+        ) and previous.get("color") == event.get("color") and previous.get("size") == event.get("size")
+
+    def flush(self, board_id: str):
+        handle = self._handles.pop(board_id, None)
+        if handle is not None:
+            handle.cancel()
+        events = self._pending.pop(board_id, None)
+        if events:
+            self._broadcast(board_id, {
+                "type": "draw_batch",
+                "data": {"board_id": board_id, "events": events}
+            })
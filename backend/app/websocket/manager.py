@@ -1,119 +1,220 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
+from fastapi import WebSocket
+from typing import Callable, Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.websocket.presence import PresenceTracker
+from app.websocket.draw_batcher import DrawBatcher
+from datetime import datetime
+from app.websocket import protocol as wire
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 队列溢出被踢掉的客户端用 1013 (Try Again Later) 关闭，前端可以稍后重连
+EVICTED_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """单个连接的有界发送队列和写协程，慢客户端只会拖慢自己"""
+
+    def __init__(self, websocket: WebSocket, user_id: int, board_id: str = None, protocol: str = None):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.board_id = board_id
+        self.protocol = protocol
+        self.binary = wire.is_binary(protocol)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WEBSOCKET_SEND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self, on_failure):
+        self.writer_task = asyncio.create_task(self._writer(on_failure))
+
+    def enqueue(self, payload) -> bool:
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _writer(self, on_failure):
+        while not self.closed:
+            payload = await self.queue.get()
+            if self.binary:
+                sending = self.websocket.send_bytes(payload)
+            else:
+                sending = self.websocket.send_text(payload)
+            # 不用 wait_for：它在发送恰好完成时可能吞掉取消，导致写协程无法退出
+            send = asyncio.ensure_future(sending)
+            try:
+                done, _ = await asyncio.wait({send}, timeout=settings.WEBSOCKET_SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                send.cancel()
+                raise
+            if not done:
+                send.cancel()
+                logger.warning(f"Send to user {self.user_id} timed out")
+                on_failure(self)
+                return
+            if send.exception() is not None:
+                logger.warning(f"Error sending to user {self.user_id}: {send.exception()!r}")
+                on_failure(self)
+                return
+
+    def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        self.user_connections: Dict[int, WebSocket] = {}
-        self.online_users: Dict[int, dict] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int, board_id: str = None):
-        await websocket.accept()
-        
-        self.user_connections[user_id] = websocket
-        
+        self.active_connections: Dict[str, List[ClientConnection]] = {}
+        self.user_connections: Dict[int, ClientConnection] = {}
+        self.presence = PresenceTracker(
+            lambda message: self._fan_out(self.user_connections.values(), message),
+            settings.PRESENCE_COALESCE_MS / 1000
+        )
+        self.draw_batcher = DrawBatcher(
+            lambda board_id, message: self._fan_out(self.active_connections.get(board_id, ()), message),
+            settings.WHITEBOARD_BATCH_TICK_MS / 1000,
+            settings.WHITEBOARD_MIN_POINT_DISTANCE
+        )
+        self.evicted_count = 0
+
+    @property
+    def online_users(self) -> Dict[int, dict]:
+        return self.presence.members
+
+    async def connect(self, websocket: WebSocket, user_id: int, board_id: str = None,
+                      info: dict = None, initial: Callable[[], List[dict]] = None) -> ClientConnection:
+        # 客户端在 Sec-WebSocket-Protocol 里声明 lms.msgpack.v1 时走二进制，否则 JSON
+        protocol = wire.negotiate(getattr(websocket, "scope", {}).get("subprotocols", []))
+        await websocket.accept(subprotocol=protocol)
+
+        connection = ClientConnection(websocket, user_id, board_id, protocol)
+        connection.start(self._evict)
+
+        # 初始消息在加入广播之前同步入队，保证它排在之后所有实时消息的前面
+        if initial is not None:
+            for message in initial():
+                self._fan_out([connection], message)
+
+        self.user_connections[user_id] = connection
+
         if board_id:
             if board_id not in self.active_connections:
                 self.active_connections[board_id] = []
-            self.active_connections[board_id].append(websocket)
-        
-        self.online_users[user_id] = {
+            self.active_connections[board_id].append(connection)
+
+        # 新连接单独拿一份快照，其他人只收到合并后的增量
+        self.presence.join(user_id, {
+            **(info or {}),
             "user_id": user_id,
             "board_id": board_id,
-            "connected_at": None
-        }
-        
-        await self.broadcast_online_users()
+            "connected_at": datetime.utcnow().isoformat()
+        })
+        self._fan_out([connection], self.presence.snapshot())
         logger.info(f"User {user_id} connected to board {board_id}")
+        return connection
 
-    def disconnect(self, user_id: int, board_id: str = None):
-        websocket = self.user_connections.pop(user_id, None)
-        self.online_users.pop(user_id, None)
-        
-        if board_id and websocket:
-            if board_id in self.active_connections:
-                if websocket in self.active_connections[board_id]:
-                    self.active_connections[board_id].remove(websocket)
-                if not self.active_connections[board_id]:
-                    del self.active_connections[board_id]
-        
+    def disconnect(self, user_id: int, board_id: str = None, connection: ClientConnection = None):
+        connection = connection or self.user_connections.get(user_id)
+        if connection is None:
+            return
+
+        self._remove(connection)
+        connection.close()
         logger.info(f"User {user_id} disconnected from board {board_id}")
 
+    def _remove(self, connection: ClientConnection):
+        # 只移除这一个连接；同一用户重连后的新连接不受旧连接断开影响
+        if self.user_connections.get(connection.user_id) is connection:
+            del self.user_connections[connection.user_id]
+            self.presence.leave(connection.user_id)
+
+        board_id = connection.board_id
+        if board_id and board_id in self.active_connections:
+            if connection in self.active_connections[board_id]:
+                self.active_connections[board_id].remove(connection)
+            if not self.active_connections[board_id]:
+                del self.active_connections[board_id]
+
+    def _evict(self, connection: ClientConnection):
+        if connection.closed:
+            return
+        self.evicted_count += 1
+        logger.warning(f"Evicting slow connection for user {connection.user_id}")
+        self._remove(connection)
+        connection.close(code=EVICTED_CLOSE_CODE)
+
+    def _fan_out(self, connections: Iterable[ClientConnection], message: dict) -> int:
+        """每种协议只序列化一次，入队即返回，各连接的写协程并发发送"""
+        payloads = {}
+        targets = list(connections)
+        for connection in targets:
+            payload = payloads.get(connection.binary)
+            if payload is None:
+                payload = payloads[connection.binary] = wire.encode(connection.protocol, message)
+            if not connection.enqueue(payload):
+                self._evict(connection)
+        return len(targets)
+
+    async def send_to(self, connection: ClientConnection, message: dict):
+        self._fan_out([connection], message)
+
     async def send_personal_message(self, message: dict, user_id: int):
-        websocket = self.user_connections.get(user_id)
-        if websocket:
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending personal message to user {user_id}: {e}")
-                self.disconnect(user_id)
+        connection = self.user_connections.get(user_id)
+        if connection:
+            self._fan_out([connection], message)
 
     async def broadcast_to_board(self, board_id: str, message: dict):
         if board_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[board_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to board {board_id}: {e}")
-                    disconnected.append(connection)
-            
-            for connection in disconnected:
-                self.active_connections[board_id].remove(connection)
+            self._fan_out(self.active_connections[board_id], message)
+
+    async def send_presence(self, connection: ClientConnection, version: int = None):
+        """客户端请求或版本号对不上时补发完整快照"""
+        if version is None or version != self.presence.version:
+            self._fan_out([connection], self.presence.snapshot())
+
+    def queue_draw(self, board_id: str, draw_data: dict):
+        """绘制事件先进聚合器，按 tick 合并成一帧广播"""
+        self.draw_batcher.add(board_id, draw_data)
 
     async def broadcast_online_users(self):
-        online_list = list(self.online_users.values())
-        message = {
-            "type": "online_users",
-            "data": online_list
-        }
-        
-        for user_id, websocket in self.user_connections.items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting online users to {user_id}: {e}")
+        self._fan_out(self.user_connections.values(), self.presence.snapshot())
 
     async def broadcast_signin_status(self, signin_id: str, status: dict):
         message = {
             "type": "signin_status",
             "data": status
         }
-        
-        for user_id, websocket in self.user_connections.items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting signin status: {e}")
+        self._fan_out(self.user_connections.values(), message)
 
     async def handle_activity_update(self, user_id: int, activity_data: dict):
         message = {
             "type": "activity_update",
             "data": activity_data
         }
-        
-        for connection in self.user_connections.values():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting activity update: {e}")
+        self._fan_out(self.user_connections.values(), message)
 
     async def broadcast_quiz_result(self, assignment_id: int, result: dict):
         message = {
             "type": "quiz_result",
             "data": result
         }
-        
-        for connection in self.user_connections.values():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting quiz result: {e}")
+        self._fan_out(self.user_connections.values(), message)
 
 
 manager = ConnectionManager()
@@ -0,0 +1,65 @@
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+
+
+class PresenceTracker:
+    """在线用户表和版本号，加入/离开在一个短窗口内合并成一条增量广播"""
+
+    def __init__(self, broadcast: Callable[[dict], None], window: float):
+        self._broadcast = broadcast
+        self.window = window
+        self.members: Dict[int, dict] = {}
+        self.version = 0
+        # 上次广播时客户端看到的在线表，用来把窗口内的变化折算成净增量
+        self._published: Dict[int, dict] = {}
+        self._dirty: Set[int] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def join(self, user_id: int, info: dict):
+        self.members[user_id] = info
+        self._touch(user_id)
+
+    def leave(self, user_id: int):
+        if self.members.pop(user_id, None) is not None:
+            self._touch(user_id)
+
+    def _touch(self, user_id: int):
+        self._dirty.add(user_id)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        joined: List[dict] = []
+        left: List[int] = []
+        for user_id in self._dirty:
+            info = self.members.get(user_id)
+            if info is not None:
+                if self._published.get(user_id) != info:
+                    joined.append(info)
+                    self._published[user_id] = info
+            elif self._published.pop(user_id, None) is not None:
+                left.append(user_id)
+        self._dirty.clear()
+
+        # 窗口内加入又离开的用户不产生增量，也不增加版本号
+        if not joined and not left:
+            return
+        self.version += 1
+        self._broadcast({
+            "type": "presence_delta",
+            "data": {
+                "version": self.version,
+                "base": self.version - 1,
+                "joined": joined,
+                "left": left
+            }
+        })
+
+    def snapshot(self) -> dict:
+        """完整在线列表；版本号对应最近一次增量，之后的变化由下一条增量补上"""
+        return {
+            "type": "online_users",
+            "version": self.version,
+            "data": list(self.members.values())
+        }
@@ -0,0 +1,93 @@
+from typing import Iterable, Optional, Union
+from fastapi import WebSocket, WebSocketDisconnect
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:  # 二进制协议可选，未安装 msgpack 时只协商 JSON
+    msgpack = None
+
+JSON_PROTOCOL = "lms.json.v1"
+MSGPACK_PROTOCOL = "lms.msgpack.v1"
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+
+class InvalidMessage(ValueError):
+    pass
+
+
+def supported_protocols() -> list:
+    return [MSGPACK_PROTOCOL, JSON_PROTOCOL] if msgpack is not None else [JSON_PROTOCOL]
+
+
+def negotiate(offered: Iterable[str]) -> Optional[str]:
+    """按客户端给出的顺序挑第一个服务端支持的子协议；没有子协议时用默认 JSON"""
+    supported = supported_protocols()
+    for protocol in offered:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def is_binary(protocol: Optional[str]) -> bool:
+    return protocol == MSGPACK_PROTOCOL
+
+
+def encode_json(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _pack_deltas(deltas: list) -> dict:
+    # 差分坐标绝大多数很小，能放进 int16 就用 2 字节，否则退回 int32
+    if all(INT16_MIN <= v <= INT16_MAX for v in deltas):
+        return {"w": 2, "d": struct.pack(f"<{len(deltas)}h", *deltas)}
+    return {"w": 4, "d": struct.pack(f"<{len(deltas)}i", *deltas)}
+
+
+def _pack_draw_batch(message: dict) -> dict:
+    events = []
+    for event in message["data"]["events"]:
+        if event.get("encoding") == "delta":
+            points = {**event["points"], **_pack_deltas(event["points"]["d"])}
+            event = {**event, "points": points, "encoding": "packed"}
+        events.append(event)
+    return {**message, "data": {**message["data"], "events": events}}
+
+
+def encode_msgpack(message: dict) -> bytes:
+    """MessagePack 编码；draw_batch 的差分坐标打包成小端定长整数数组"""
+    if message.get("type") == "draw_batch":
+        message = _pack_draw_batch(message)
+    return msgpack.packb(message, use_bin_type=True, default=str)
+
+
+def encode(protocol: Optional[str], message: dict) -> Union[str, bytes]:
+    return encode_msgpack(message) if is_binary(protocol) else encode_json(message)
+
+
+def decode(protocol: Optional[str], payload: Union[str, bytes]) -> dict:
+    """解析客户端消息，格式不对时抛 InvalidMessage"""
+    try:
+        if is_binary(protocol) and isinstance(payload, bytes):
+            message = msgpack.unpackb(payload, raw=False)
+        else:
+            if isinstance(payload, bytes):
+                payload = payload.decode("utf-8")
+            message = json.loads(payload)
+    except Exception as e:
+        raise InvalidMessage(str(e))
+    if not isinstance(message, dict):
+        raise InvalidMessage("Message must be an object")
+    return message
+
+
+async def receive_payload(websocket: WebSocket) -> Union[str, bytes]:
+    """同时接收文本帧和二进制帧"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    return message.get("text") or ""
@@ -4,17 +4,26 @@ LMS-Edge Flask API Server v3.1
 Full-featured Classroom LAN Teaching Management System
 """
 
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file, g, has_app_context
 import sqlite3
 import json
 import os
-import hashlib
 import time
 import uuid
 import shutil
 import logging
+import atexit
 from datetime import datetime, timedelta
 from functools import wraps
+from app.core.simple_security import hash_password, verify_password, verify_and_update
+from app.core.sqlite_pool import SQLitePool, default_pragmas
+from app.services.audit_log import AuditLog
+from app.services.game_engine import GameEngine
+from app.services.game_events import GameEventHub
+from app.services.game_store import SQLiteGameStore
+from app.services.last_active import LastActiveBuffer
+from app.services.presence import PresenceService
+from app.services.whiteboard_store import WhiteboardStore
 
 # 配置日志
 logging.basicConfig(
@@ -41,18 +50,66 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
 os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
 
+# 登录、自动签到刷新在线状态，在线列表直接读内存，不再扫描 users.last_active
+ONLINE_TIMEOUT = float(os.environ.get('ONLINE_TIMEOUT_SECONDS', 300))
+online_presence = PresenceService(ONLINE_TIMEOUT)
+
 ALLOWED_ATTACHMENT_EXTENSIONS = {'xlsx', 'xls', 'doc', 'docx', 'zip', 'rar', 'jpg', 'jpeg', 'png', 'gif', 'pdf'}
 ALLOWED_SUBMISSION_EXTENSIONS = {'zip', 'rar', 'jpg', 'jpeg', 'png', 'gif', 'pdf', 'doc', 'docx'}
 
+# 连接池：PRAGMA 只在建连接时执行一次，之后连接和预编译语句都复用
+db_pool = SQLitePool(
+    DB_PATH,
+    size=int(os.environ.get('SQLITE_POOL_SIZE', 8)),
+    pragmas=default_pragmas(
+        cache_size=int(os.environ.get('SQLITE_CACHE_SIZE', -16000)),
+        mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+    )
+)
+# atexit 后注册先执行：写回缓冲 flush 完之后才关闭连接
+atexit.register(db_pool.close_all)
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=30)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # 同一个请求里多次 get_db() 拿到的是同一个连接，请求结束时统一还给连接池
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = db_pool.acquire()
+            conn.request_bound = True
+            g.db_conn = conn
+        return conn
+    return db_pool.acquire()
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# 操作日志异步批量写入，队列满时丢弃并计数
+audit_log = AuditLog(
+    get_db,
+    flush_interval=float(os.environ.get('AUDIT_LOG_FLUSH_SECONDS', 0.3)),
+    batch_size=int(os.environ.get('AUDIT_LOG_BATCH_SIZE', 200)),
+    max_pending=int(os.environ.get('AUDIT_LOG_MAX_PENDING', 10000))
+)
+atexit.register(audit_log.close)
+
+# 心跳的 last_active 先进内存，每隔几秒一个事务批量写回
+last_active_buffer = LastActiveBuffer(get_db, float(os.environ.get('LAST_ACTIVE_FLUSH_SECONDS', 5)))
+atexit.register(last_active_buffer.flush)
 
 def allowed_file(filename, allowed_set):
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     return ext in allowed_set
 
+INDEX_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS ix_submissions_assignment_correct ON submissions (assignment_id, is_correct, score)',
+    'CREATE INDEX IF NOT EXISTS ix_submissions_user_correct ON submissions (user_id, is_correct)',
+    'CREATE INDEX IF NOT EXISTS ix_submissions_user_assignment ON submissions (user_id, assignment_id)',
+    'CREATE INDEX IF NOT EXISTS ix_attendances_user_login ON attendances (user_id, login_time)',
+]
+
 def init_db():
     conn = sqlite3.connect(DB_PATH, isolation_level=None)
     cursor = conn.cursor()
@@ -126,31 +183,27 @@ def init_db():
     )
     ''')
     
+    for index_sql in INDEX_STATEMENTS:
+        cursor.execute(index_sql)
+    
     default_users = [
-        ('admin', hashlib.sha256('admin123'.encode()).hexdigest(), 'Administrator', 'admin'),
-        ('teacher', hashlib.sha256('teacher123'.encode()).hexdigest(), 'Teacher', 'teacher'),
-        ('student', hashlib.sha256('student123'.encode()).hexdigest(), 'Student', 'student'),
+        ('admin', 'admin123', 'Administrator', 'admin'),
+        ('teacher', 'teacher123', 'Teacher', 'teacher'),
+        ('student', 'student123', 'Student', 'student'),
     ]
     
-    for username, pwd_hash, full_name, role in default_users:
+    for username, password, full_name, role in default_users:
         cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
         if not cursor.fetchone():
             cursor.execute('INSERT INTO users (username, password_hash, full_name, role) VALUES (?, ?, ?, ?)',
-                          (username, pwd_hash, full_name, role))
+                          (username, hash_password(password), full_name, role))
     
     conn.commit()
     conn.close()
 
 def log_operation(user_id, username, action, target, details):
-    try:
-        conn = get_db()
-        conn.execute('''INSERT INTO operation_logs (user_id, username, action, target, details) 
-                       VALUES (?, ?, ?, ?, ?)''',
-                      (user_id, username, action, target, details))
-        conn.commit()
-        conn.close()
-    except Exception:
-        pass
+    # 只入队，由 audit_log 的后台线程批量写入 operation_logs
+    audit_log.record(user_id, username, action, target, details)
 
 @app.after_request
 def after_request(response):
@@ -200,22 +253,31 @@ def login():
     conn.close()
     
     if user:
-        pwd_hash = hashlib.sha256(password.encode()).hexdigest()
-        if user['password_hash'] == pwd_hash:
+        verified, new_hash = verify_and_update(password, user['password_hash'])
+        if verified:
             conn = get_db()
             cursor = conn.cursor()
-            cursor.execute('UPDATE users SET last_active = ? WHERE id = ?', (datetime.now().isoformat(), user['id']))
+            if new_hash:
+                cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
             
             last_att = conn.execute('SELECT * FROM attendances WHERE user_id = ? ORDER BY login_time DESC LIMIT 1', (user['id'],)).fetchone()
             if last_att and not last_att['logout_time']:
-                pass
+                attendance_id = last_att['id']
             else:
                 cursor.execute('INSERT INTO attendances (user_id, activity_score) VALUES (?, ?)', (user['id'], 100))
-                cursor.execute('UPDATE attendances SET last_active = ? WHERE id = ?', (datetime.now().isoformat(), cursor.lastrowid))
+                attendance_id = cursor.lastrowid
             
             conn.commit()
             conn.close()
+            last_active_buffer.remember_attendance(user['id'], attendance_id)
+            last_active_buffer.touch(user['id'], datetime.now().isoformat(), attendance_id)
             
+            online_presence.touch(user['id'], {
+                'id': user['id'],
+                'username': user['username'],
+                'full_name': user['full_name'],
+                'role': user['role']
+            })
             log_operation(user['id'], user['username'], 'LOGIN', 'auth', '用户登录成功')
             return jsonify({
                 'token': f'token_{user["id"]}_{int(time.time())}',
@@ -234,7 +296,7 @@ def get_users():
     conn = get_db()
     users = conn.execute('SELECT id, username, full_name, role, last_active, created_at FROM users WHERE deleted = 0 ORDER BY id').fetchall()
     conn.close()
-    return jsonify({'users': [dict(u) for u in users]})
+    return jsonify({'users': [last_active_buffer.overlay(u) for u in users]})
 
 @app.route('/api/users/create', methods=['POST'])
 def create_user():
@@ -245,7 +307,7 @@ def create_user():
     conn = get_db()
     cursor = conn.cursor()
     try:
-        pwd_hash = hashlib.sha256(data.get('password').encode()).hexdigest()
+        pwd_hash = hash_password(data.get('password'))
         cursor.execute('''INSERT INTO users (username, password_hash, full_name, role) 
                          VALUES (?, ?, ?, ?)''',
                          (data.get('username'), pwd_hash, data.get('full_name'), data.get('role', 'student')))
@@ -264,7 +326,7 @@ def get_user_detail(user_id):
     user = conn.execute('SELECT id, username, full_name, role, last_active, created_at FROM users WHERE id = ? AND deleted = 0', (user_id,)).fetchone()
     conn.close()
     if user:
-        return jsonify({'user': dict(user)})
+        return jsonify({'user': last_active_buffer.overlay(user)})
     return jsonify({'error': '用户不存在'}), 404
 
 @app.route('/api/users/', methods=['PUT'])
@@ -283,7 +345,7 @@ def update_user():
         values.append(data.get('role'))
     if data.get('password'):
         updates.append('password_hash = ?')
-        values.append(hashlib.sha256(data.get('password').encode()).hexdigest())
+        values.append(hash_password(data.get('password')))
     
     if updates:
         values.append(data.get('id'))
@@ -309,9 +371,9 @@ def change_password():
     cursor = conn.cursor()
     user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     
-    if user and user['password_hash'] == hashlib.sha256(old_password.encode()).hexdigest():
+    if user and verify_password(old_password, user['password_hash']):
         cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
-                      (hashlib.sha256(new_password.encode()).hexdigest(), user_id))
+                      (hash_password(new_password), user_id))
         log_operation(user_id, user['username'], 'PASSWORD', 'user', '修改密码')
         conn.commit()
         conn.close()
@@ -332,6 +394,8 @@ def delete_user(user_id):
     log_operation(user_id, user['username'] if user else 'unknown', 'DELETE', 'user', f'删除用户ID: {user_id}')
     conn.commit()
     conn.close()
+    online_presence.remove(user_id)
+    last_active_buffer.forget(user_id)
     return jsonify({'success': True})
 
 @app.route('/api/assignments', methods=['GET'])
@@ -581,13 +645,9 @@ def submit_assignment():
                        (user_id, assignment_id, answer, score, is_correct))
         log_msg = 'CREATE'
     
-    conn.commit()
+    user = conn.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
     conn.close()
-    if log_msg:
-        conn2 = get_db()
-        user = conn2.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
-        conn2.close()
-        log_operation(user_id, user['username'] if user else 'unknown', log_msg, 'submission', f'作答作业ID: {assignment_id}')
+    log_operation(user_id, user['username'] if user else 'unknown', log_msg, 'submission', f'作答作业ID: {assignment_id}')
     
     result = {'success': True, 'submitted': True}
     if assignment_type in ['single_choice', 'multiple_choice']:
@@ -678,13 +738,9 @@ def get_attendance_records():
 
 @app.route('/api/attendance/online', methods=['GET'])
 def get_online_users():
-    conn = get_db()
-    threshold = (datetime.now() - timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S')
-    online = conn.execute('''SELECT id, username, full_name, role, last_active FROM users 
-                            WHERE deleted = 0 AND last_active > ? 
-                            ORDER BY last_active DESC''', (threshold,)).fetchall()
-    conn.close()
-    return jsonify({'online': [dict(u) for u in online], 'threshold': threshold})
+    threshold = (datetime.now() - timedelta(seconds=ONLINE_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    online = online_presence.online()
+    return jsonify({'online': online, 'count': len(online), 'threshold': threshold})
 
 @app.route('/api/attendance/auto', methods=['POST'])
 def auto_signin():
@@ -694,18 +750,32 @@ def auto_signin():
     if not user_id:
         return jsonify({'error': '用户ID不能为空'}), 400
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET last_active = ? WHERE id = ?', (datetime.now().isoformat(), user_id))
-    
-    last_att = conn.execute('SELECT * FROM attendances WHERE user_id = ? ORDER BY login_time DESC LIMIT 1', (user_id,)).fetchone()
-    if last_att and not last_att['logout_time']:
-        cursor.execute('UPDATE attendances SET last_active = ? WHERE id = ?', (datetime.now().isoformat(), last_att['id']))
+    # 稳定状态下心跳不碰数据库：在线状态和考勤记录 id 都在内存里，
+    # 只有第一次上线时查一次用户信息和当前考勤记录
+    attendance_id = last_active_buffer.open_attendance(user_id)
+    if attendance_id is None or not online_presence.is_online(user_id):
+        conn = get_db()
+        cursor = conn.cursor()
+        user = conn.execute('SELECT id, username, full_name, role FROM users WHERE id = ? AND deleted = 0',
+                            (user_id,)).fetchone()
+        if user:
+            online_presence.touch(user_id, dict(user))
+        
+        if attendance_id is None:
+            last_att = conn.execute('SELECT * FROM attendances WHERE user_id = ? ORDER BY login_time DESC LIMIT 1', (user_id,)).fetchone()
+            if last_att and not last_att['logout_time']:
+                attendance_id = last_att['id']
+            else:
+                cursor.execute('INSERT INTO attendances (user_id, activity_score) VALUES (?, ?)', (user_id, 100))
+                attendance_id = cursor.lastrowid
+            last_active_buffer.remember_attendance(user_id, attendance_id)
+        
+        conn.commit()
+        conn.close()
     else:
-        cursor.execute('INSERT INTO attendances (user_id, activity_score) VALUES (?, ?)', (user_id, 100))
+        online_presence.touch(user_id)
     
-    conn.commit()
-    conn.close()
+    last_active_buffer.touch(user_id, datetime.now().isoformat(), attendance_id)
     return jsonify({'success': True})
 
 @app.route('/api/stats/class', methods=['GET'])
@@ -743,16 +813,34 @@ def get_my_stats():
 
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
+    # 按 id 倒序的游标分页：before_id 取上一页的 next_before_id，翻多少页都走主键
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 500)
+    before_id = request.args.get('before_id', type=int)
     conn = get_db()
-    limit = 200
-    logs = conn.execute('''SELECT * FROM operation_logs ORDER BY created_at DESC LIMIT ?''', (limit,)).fetchall()
+    if before_id is None:
+        # 第一页先把队列里的记录写进去，刚做的操作马上能看到
+        audit_log.flush()
+        logs = conn.execute('SELECT * FROM operation_logs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    else:
+        logs = conn.execute('SELECT * FROM operation_logs WHERE id < ? ORDER BY id DESC LIMIT ?',
+                            (before_id, limit)).fetchall()
     conn.close()
-    return jsonify({'logs': [dict(l) for l in logs]})
+    return jsonify({
+        'logs': [dict(l) for l in logs],
+        'next_before_id': logs[-1]['id'] if len(logs) == limit else None,
+        'dropped': audit_log.dropped
+    })
 
 import threading
 import time
 
-whiteboard_lock = threading.Lock()
+# 白板状态常驻内存，whiteboard.json 由 WhiteboardStore 合并后异步写盘
+whiteboard = WhiteboardStore(
+    os.path.join(STATIC_DIR, 'whiteboard.json'),
+    flush_delay=float(os.environ.get('WHITEBOARD_FLUSH_DELAY', 1.0)),
+    online_timeout=float(os.environ.get('WHITEBOARD_ONLINE_TIMEOUT', 30))
+)
+atexit.register(whiteboard.flush)
 
 @app.route('/api/whiteboard', methods=['POST'])
 def save_whiteboard():
@@ -761,109 +849,47 @@ def save_whiteboard():
     content = data.get('content', '')
     drawings = data.get('drawings', [])
     
-    whiteboard_file = os.path.join(STATIC_DIR, 'whiteboard.json')
     try:
-        with whiteboard_lock:
-            if os.path.exists(whiteboard_file):
-                with open(whiteboard_file, 'r') as f:
-                    whiteboard = json.load(f)
-            else:
-                whiteboard = {'updates': [], 'drawings': [], 'allowed': False, 'online': {}}
-            
-            whiteboard['content'] = content
-            whiteboard['updated_at'] = datetime.now().isoformat()
-            
-            if drawings:
-                existing_drawings = whiteboard.get('drawings', [])
-                existing_drawings.extend(drawings)
-                whiteboard['drawings'] = existing_drawings[-500:]
-            
-            online_users = whiteboard.get('online', {})
-            online_users[str(user_id)] = datetime.now().isoformat()
-            for uid in list(online_users.keys()):
-                last_time = datetime.fromisoformat(online_users[uid])
-                if (datetime.now() - last_time).seconds > 30:
-                    del online_users[uid]
-            whiteboard['online'] = online_users
-            whiteboard['online_count'] = len(online_users)
-            
-            with open(whiteboard_file, 'w') as f:
-                json.dump(whiteboard, f)
-        
+        whiteboard.save(user_id, content, drawings)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/whiteboard/settings', methods=['GET', 'POST'])
 def whiteboard_settings():
-    whiteboard_file = os.path.join(STATIC_DIR, 'whiteboard.json')
-    
     if request.method == 'POST':
         data = request.get_json()
         allowed = data.get('allowed', False)
         try:
-            if os.path.exists(whiteboard_file):
-                with open(whiteboard_file, 'r') as f:
-                    whiteboard = json.load(f)
-            else:
-                whiteboard = {'updates': [], 'allowed': False}
-            whiteboard['allowed'] = allowed
-            whiteboard['updated_at'] = datetime.now().isoformat()
-            with open(whiteboard_file, 'w') as f:
-                json.dump(whiteboard, f)
+            whiteboard.set_allowed(allowed)
             return jsonify({'success': True})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
-    try:
-        if os.path.exists(whiteboard_file):
-            with open(whiteboard_file, 'r') as f:
-                whiteboard = json.load(f)
-            return jsonify({'allowed': whiteboard.get('allowed', False)})
-        return jsonify({'allowed': False})
-    except:
-        return jsonify({'allowed': False})
+    return jsonify({'allowed': whiteboard.allowed})
 
 @app.route('/api/whiteboard', methods=['GET'])
 def get_whiteboard():
-    whiteboard_file = os.path.join(STATIC_DIR, 'whiteboard.json')
-    if os.path.exists(whiteboard_file):
-        try:
-            with open(whiteboard_file, 'r') as f:
-                return jsonify(json.load(f))
-        except:
-            pass
-    return jsonify({'drawings': [], 'content': '', 'allowed': False, 'online_count': 0})
+    # 带 since 的轮询只返回之后的笔画，稳定状态下只有几十字节
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return jsonify(whiteboard.changes_since(since))
+    
+    # 没有变化时浏览器带 If-None-Match 重新验证，直接返回 304
+    etag, body = whiteboard.render()
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/api/whiteboard/heartbeat', methods=['POST'])
 def whiteboard_heartbeat():
     data = request.get_json()
     user_id = data.get('user_id')
     
-    whiteboard_file = os.path.join(STATIC_DIR, 'whiteboard.json')
     try:
-        with whiteboard_lock:
-            if os.path.exists(whiteboard_file):
-                with open(whiteboard_file, 'r') as f:
-                    whiteboard = json.load(f)
-            else:
-                whiteboard = {'updates': [], 'drawings': [], 'allowed': False, 'online': {}}
-            
-            online_users = whiteboard.get('online', {})
-            online_users[str(user_id)] = datetime.now().isoformat()
-            
-            for uid in list(online_users.keys()):
-                last_time = datetime.fromisoformat(online_users[uid])
-                if (datetime.now() - last_time).seconds > 30:
-                    del online_users[uid]
-            
-            whiteboard['online'] = online_users
-            whiteboard['online_count'] = len(online_users)
-            
-            with open(whiteboard_file, 'w') as f:
-                json.dump(whiteboard, f)
-        
-        return jsonify({'success': True, 'online_count': len(online_users)})
+        online_count = whiteboard.heartbeat(user_id)
+        return jsonify({'success': True, 'online_count': online_count})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -879,29 +905,14 @@ def clear_whiteboard():
     if not user or user['role'] != 'teacher':
         return jsonify({'error': '只有老师可以清空白板'}), 403
     
-    whiteboard_file = os.path.join(STATIC_DIR, 'whiteboard.json')
     try:
-        with whiteboard_lock:
-            whiteboard = {
-                'drawings': [],
-                'content': '',
-                'allowed': False,
-                'online': {},
-                'online_count': 0,
-                'updated_at': datetime.now().isoformat()
-            }
-            with open(whiteboard_file, 'w') as f:
-                json.dump(whiteboard, f)
+        whiteboard.clear()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-GAME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'game')
+GAME_DIR = os.environ.get('GAME_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'game'))
 os.makedirs(GAME_DIR, exist_ok=True)
-game_lock = threading.Lock()
-MATCHES_FILE = os.path.join(GAME_DIR, 'matches.json')
-PENDING_FILE = os.path.join(GAME_DIR, 'pending.json')
-PLAYERS_FILE = os.path.join(GAME_DIR, 'players.json')
 
 def load_json(filepath, default):
     if os.path.exists(filepath):
@@ -942,6 +953,23 @@ def get_questions():
     save_json(q_file, questions)
     return questions
 
+# 对战状态常驻内存，按比赛加锁，变化定期写进 lms.db 的 game_* 表
+game_store = SQLiteGameStore(get_db)
+game_events = GameEventHub()
+if any(os.path.exists(os.path.join(GAME_DIR, name)) for name in ('players.json', 'matches.json')):
+    # 旧版本的 JSON 数据只导入一次，导入后文件改名为 *.imported
+    logger.info('Imported legacy game data: %d players, %d matches' % game_store.import_json(GAME_DIR))
+game_engine = GameEngine(
+    game_store,
+    get_questions,
+    snapshot_interval=float(os.environ.get('GAME_SNAPSHOT_SECONDS', 2.0)),
+    retention=float(os.environ.get('GAME_MATCH_RETENTION_SECONDS', 600)),
+    events=game_events
+)
+# 推送连接上没有事件时隔一段时间发一行注释，防止代理超时断开，也能及时发现断线
+GAME_EVENTS_KEEPALIVE = float(os.environ.get('GAME_EVENTS_KEEPALIVE_SECONDS', 15))
+atexit.register(game_engine.snapshot)
+
 @app.route('/api/game/player', methods=['GET'])
 def get_player_game_data():
     user_id = request.args.get('user_id', type=int)
@@ -951,23 +979,34 @@ def get_player_game_data():
     if not user:
         return jsonify({'error': '用户不存在'}), 404
     
-    players = load_json(PLAYERS_FILE, [])
-    player = next((p for p in players if p['user_id'] == user_id), None)
-    
-    if not player:
-        player = {
-            'user_id': user_id,
-            'username': user['username'],
-            'full_name': user['full_name'] or user['username'],
-            'gold': 10,
-            'medals': 0,
-            'wins': 0,
-            'inventory': [{'e': '🍎', 't': 'heal', 'name': '苹果'}]
-        }
-        players.append(player)
-        save_json(PLAYERS_FILE, players)
+    return jsonify({'player': game_engine.get_player(user_id, user)})
+
+@app.route('/api/game/events', methods=['GET'])
+def game_event_stream():
+    # Server-Sent Events：matched / opponent_answered / round_result / game_over
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({'error': '参数不完整'}), 400
+    
+    subscription = game_events.subscribe(user_id)
     
-    return jsonify({'player': player})
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.closed:
+                event = subscription.get(GAME_EVENTS_KEEPALIVE)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event['type'] == 'round_result':
+                    # 生成器恢复执行时上一段已经写进连接，这时才算对手看过这一回合
+                    game_engine.round_delivered(event['match_id'], user_id, event['round_result']['question_idx'])
+        finally:
+            game_events.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/game/match', methods=['POST'])
 def game_match():
@@ -980,80 +1019,21 @@ def game_match():
     if not user:
         return jsonify({'success': False, 'message': '用户不存在'})
     
-    pending = load_json(PENDING_FILE, [])
-    matches = load_json(MATCHES_FILE, [])
-    
-    pending = [p for p in pending if p['expires'] > datetime.now().timestamp()]
-    
-    print(f"[MATCH] User {user_id} joining, pending before={[p['user_id'] for p in pending]}")
-    
-    for i, p in enumerate(pending):
-        if p['user_id'] != user_id:
-            match_id = str(int(datetime.now().timestamp())) + str(user_id)
-            opponent = p['user_data']
-            questions = get_questions()
-            
-            match = {
-                'match_id': match_id,
-                'player1': p['user_id'],
-                'player2': user_id,
-                'player1_data': opponent,
-                'player2_data': {'user_id': user_id, 'username': user['username'], 'full_name': user['full_name'] or user['username']},
-                'player1_hp': 100,
-                'player2_hp': 100,
-                'player1_answered': False,
-                'player2_answered': False,
-                'player1_answer': None,
-                'player2_answer': None,
-                'player1_correct': None,
-                'player2_correct': None,
-                'current_question_idx': 0,
-                'questions': questions,
-                'my_turn': 1,
-                'created_at': datetime.now().isoformat(),
-                'game_over': False,
-                'winner': None
-            }
-            
-            pending.pop(i)
-            matches.append(match)
-            save_json(PENDING_FILE, pending)
-            save_json(MATCHES_FILE, matches)
-            
-            print(f"[MATCH] Match created: {match_id}, P1={p['user_id']}, P2={user_id}")
-            return jsonify({'success': True, 'match_id': match_id, 'opponent': opponent, 'is_player1': False, 'player1_id': p['user_id']})
-    
-    pending.append({
-        'user_id': user_id,
-        'user_data': {'user_id': user_id, 'username': user['username'], 'full_name': user['full_name'] or user['username']},
-        'expires': datetime.now().timestamp() + 60
-    })
-    save_json(PENDING_FILE, pending)
-    
-    print(f"[MATCH] User {user_id} added to pending")
-    return jsonify({'success': False, 'message': '等待匹配中...'})
+    match, opponent = game_engine.join(user_id, user)
+    if match is None:
+        return jsonify({'success': False, 'message': '等待匹配中...'})
+    # 已在比赛中的用户拿回原来那一场，可能是 player1
+    return jsonify({'success': True, 'match_id': match['match_id'], 'opponent': opponent,
+                    'is_player1': match['player1'] == user_id, 'player1_id': match['player1']})
 
 @app.route('/api/game/check', methods=['GET'])
 def check_game_match():
     user_id = request.args.get('user_id', type=int)
     
-    matches = load_json(MATCHES_FILE, [])
-    pending = load_json(PENDING_FILE, [])
-    
-    print(f"[CHECK] User {user_id}: matches={len(matches)}, pending={len(pending)}")
-    
-    for m in matches:
-        if not m['game_over'] and (m['player1'] == user_id or m['player2'] == user_id):
-            print(f"[CHECK] User {user_id}: found in match {m['match_id']}")
-            return jsonify({'in_match': True, 'match': m})
-    
-    for p in pending:
-        if p['user_id'] == user_id:
-            print(f"[CHECK] User {user_id}: found in pending")
-            return jsonify({'in_match': False, 'matching': True})
-    
-    print(f"[CHECK] User {user_id}: not found, pending users={[p['user_id'] for p in pending]}")
-    return jsonify({'in_match': False, 'matching': False})
+    match = game_engine.active_match(user_id)
+    if match:
+        return jsonify({'in_match': True, 'match': match})
+    return jsonify({'in_match': False, 'matching': game_engine.is_matching(user_id)})
 
 @app.route('/api/game/students', methods=['GET'])
 def get_students_game_status():
@@ -1061,26 +1041,10 @@ def get_students_game_status():
     students = conn.execute("SELECT id, username, full_name FROM users WHERE role = 'student'").fetchall()
     conn.close()
     
-    matches = load_json(MATCHES_FILE, [])
-    pending = load_json(PENDING_FILE, [])
-    
+    statuses = game_engine.statuses([s['id'] for s in students])
     results = []
     for s in students:
-        status = 'offline'
-        for p in pending:
-            if p['user_id'] == s['id']:
-                status = 'matching'
-                break
-        if status == 'offline':
-            for m in matches:
-                if not m['game_over'] and (m['player1'] == s['id'] or m['player2'] == s['id']):
-                    status = 'playing'
-                    break
-        
-        players = load_json(PLAYERS_FILE, [])
-        player = next((p for p in players if p['user_id'] == s['id']), None)
-        medals = player['medals'] if player else 0
-        
+        status, medals = statuses[s['id']]
         results.append({
             'id': s['id'],
             'username': s['username'],
@@ -1096,131 +1060,10 @@ def get_game_state():
     match_id = request.args.get('match_id')
     user_id = request.args.get('user_id', type=int)
     
-    logger.info(f"[API] get_game_state called: match_id={match_id}, user_id={user_id}")
-    
-    matches = load_json(MATCHES_FILE, [])
-    match = None
-    match_idx = -1
-    for i, m in enumerate(matches):
-        if m['match_id'] == match_id:
-            match = m
-            match_idx = i
-            break
-    
-    if not match:
+    state = game_engine.state(match_id, user_id)
+    if state is None:
         return jsonify({'success': False, 'message': '比赛不存在'})
-    
-    if match['game_over']:
-        return jsonify({'success': True, 'game_over': True, 'winner': match['winner']})
-    
-    is_p1 = match['player1'] == user_id
-    opponent_id = match['player2'] if is_p1 else match['player1']
-    
-    # 检查对手是否离开（超时或其他原因）
-    now = datetime.now()
-    timeout_seconds = 90
-    
-    # 检查对手的最后活跃时间
-    opponent_last_active_key = 'player2_last_active' if is_p1 else 'player1_last_active'
-    opponent_last_active = match.get(opponent_last_active_key)
-    player_last_active_key = 'player1_last_active' if is_p1 else 'player2_last_active'
-    player_last_active = match.get(player_last_active_key)
-    
-    opponent_left = False
-    if opponent_last_active:
-        try:
-            last_time = datetime.fromisoformat(opponent_last_active)
-            if (now - last_time).total_seconds() > timeout_seconds:
-                # 对手超时离开
-                matches[match_idx]['game_over'] = True
-                matches[match_idx]['winner'] = user_id
-                save_json(MATCHES_FILE, matches)
-                return jsonify({'success': True, 'game_over': True, 'winner': user_id, 'timeout': True, 'opponent_left': True})
-        except:
-            pass
-    else:
-        # 对手还没有发送过心跳
-        # 如果是刚创建的游戏（双方都没有心跳），不视为离开
-        if player_last_active is None:
-            # 游戏刚创建，双方都没有心跳，这是正常的
-            pass
-        else:
-            # 对手从来没有发送过心跳，但自己发送过
-            # 这可能是对手在匹配后立即退出了
-            # 不直接判定对手离开，而是继续游戏（让对手超时）
-            pass
-    
-    # 获取当前题目的状态
-    current_idx = match['current_question_idx']
-    has_question = current_idx < len(match['questions'])
-    
-    current_q = None
-    if has_question:
-        q = match['questions'][current_idx]
-        current_q = {
-            'question': q['q'],
-            'options': q['options'],
-            'is_multi': q['is_multi']
-        }
-    
-    hp = match['player1_hp'] if is_p1 else match['player2_hp']
-    opponent_hp = match['player2_hp'] if is_p1 else match['player1_hp']
-    
-    # 检查双方是否都答题了
-    both_answered = match['player1_answered'] and match['player2_answered']
-    player_answered = match['player1_answered'] if is_p1 else match['player2_answered']
-    last_round_result = match.get('last_round_result')
-    
-    logger.info(f"[API] get_game_state: user={user_id}, is_p1={is_p1}, current_idx={current_idx}, both_answered={both_answered}, player_answered={player_answered}, has_round_result={last_round_result is not None}")
-    
-    if last_round_result:
-        logger.info(f"[API] get_game_state: Returning round_result for user={user_id}, processed_by={last_round_result.get('processed_by', [])}")
-        # 检查当前玩家是否已处理过上一回合结果
-        processed_by = last_round_result.get('processed_by', [])
-        if not isinstance(processed_by, list):
-            processed_by = [processed_by] if processed_by else []
-        
-        # 如果当前玩家还没处理过，添加他到列表
-        if user_id not in processed_by:
-            processed_by.append(user_id)
-            match['last_round_result']['processed_by'] = processed_by
-            save_json(MATCHES_FILE, matches)
-        
-        # 返回上一回合结果（both_answered设为True，因为确实双方都答了）
-        lrr = last_round_result
-        is_p1 = match['player1'] == user_id
-        return jsonify({
-            'success': True,
-            'game_over': False,
-            'round_result': {
-                'p1_correct': lrr['p1_correct'],
-                'p2_correct': lrr['p2_correct'],
-                'p1_dmg': lrr['p1_dmg'],
-                'p2_dmg': lrr['p2_dmg'],
-                'p1_hp': lrr['p1_hp'],
-                'p2_hp': lrr['p2_hp']
-            },
-            'hp': lrr['p1_hp'] if is_p1 else lrr['p2_hp'],
-            'opponent_hp': lrr['p2_hp'] if is_p1 else lrr['p1_hp'],
-            'current_question': current_q,
-            'current_question_idx': current_idx,
-            'both_answered': True,  # 上一回合双方都答了
-            'player_answered': True,  # 当前玩家已答上一题
-            'total_questions': len(match['questions'])
-        })
-    
-    return jsonify({
-        'success': True,
-        'game_over': False,
-        'opponent_left': opponent_left,
-        'hp': hp,
-        'opponent_hp': opponent_hp,
-        'current_question': current_q,
-        'current_question_idx': current_idx,
-        'both_answered': both_answered,
-        'player_answered': player_answered,
-        'total_questions': len(match['questions'])
-    })
+    return jsonify(state)
 
 @app.route('/api/game/answer', methods=['POST'])
 def submit_game_answer():
@@ -1229,206 +1072,33 @@ def submit_game_answer():
     user_id = data.get('user_id')
     answer = data.get('answer')
     
-    logger.info(f"[API] submit_game_answer called: match_id={match_id}, user_id={user_id}, answer={answer}")
-    
-    matches = load_json(MATCHES_FILE, [])
-    match = None
-    match_idx = -1
-    for i, m in enumerate(matches):
-        if m['match_id'] == match_id:
-            match = m
-            match_idx = i
-            break
-    
-    if not match or match['game_over']:
+    result = game_engine.answer(match_id, user_id, answer)
+    if result is None:
         return jsonify({'success': False, 'message': '比赛不存在或已结束'})
-    
-    is_p1 = match['player1'] == user_id
-    
-    # 后端自己判断答案对错
-    current_q = match['questions'][match['current_question_idx']]
-    correct_answer = current_q['answer']
-    user_correct = sorted(answer.split(',')) == sorted(correct_answer.split(','))
-    
-    # 更新答案状态
-    if is_p1:
-        match['player1_answer'] = answer
-        match['player1_correct'] = user_correct
-        match['player1_answered'] = True
-        logger.info(f"[API] Player {user_id} (P1) answered: {answer}, correct={user_correct}, expected={correct_answer}")
-    else:
-        match['player2_answer'] = answer
-        match['player2_correct'] = user_correct
-        match['player2_answered'] = True
-        logger.info(f"[API] Player {user_id} (P2) answered: {answer}, correct={user_correct}, expected={correct_answer}")
-    
-    logger.info(f"[API] Both answered: P1={match['player1_answered']}, P2={match['player2_answered']}")
-    
-    # 检查双方是否都答题了
-    round_result = None
-    if match['player1_answered'] and match['player2_answered']:
-        logger.info("[API] Both players answered, processing round result")
-        
-        # 计算伤害
-        dmg_p1 = 0
-        dmg_p2 = 0
-        
-        p1_correct = match['player1_correct']
-        p2_correct = match['player2_correct']
-        
-        logger.info(f"[API] Damage calculation: P1_correct={p1_correct}, P2_correct={p2_correct}")
-        
-        if p1_correct and p2_correct:
-            # 双方都对 - 都不掉血
-            dmg_p1 = 0
-            dmg_p2 = 0
-            logger.info(f"[API] Both correct - no damage")
-        elif p1_correct and not p2_correct:
-            # P1对P2错 - P2掉血
-            dmg_p2 = 20
-            logger.info(f"[API] P1 correct, P2 wrong - P2 takes 20 damage")
-        elif not p1_correct and p2_correct:
-            # P1错P2对 - P1掉血
-            dmg_p1 = 20
-            logger.info(f"[API] P1 wrong, P2 correct - P1 takes 20 damage")
-        else:
-            # 双方都错 - 各掉10血
-            dmg_p1 = 10
-            dmg_p2 = 10
-            logger.info(f"[API] Both wrong - both take 10 damage")
-        
-        match['player1_hp'] = max(0, match['player1_hp'] - dmg_p1)
-        match['player2_hp'] = max(0, match['player2_hp'] - dmg_p2)
-        
-        # 记录回合结果供双方查看
-        match['last_round_result'] = {
-            'p1_correct': p1_correct,
-            'p2_correct': p2_correct,
-            'p1_dmg': dmg_p1,
-            'p2_dmg': dmg_p2,
-            'p1_hp': match['player1_hp'],
-            'p2_hp': match['player2_hp'],
-            'question_idx': match['current_question_idx'],
-            'processed_by': []
-        }
-        
-        # 记录回合结果供前端显示
-        round_result = {
-            'p1_correct': p1_correct,
-            'p2_correct': p2_correct,
-            'p1_dmg': dmg_p1,
-            'p2_dmg': dmg_p2,
-            'p1_hp': match['player1_hp'],
-            'p2_hp': match['player2_hp'],
-            'question_idx': match['current_question_idx']
-        }
-        
-        # 重置答题状态
-        match['player1_answered'] = False
-        match['player2_answered'] = False
-        match['player1_answer'] = None
-        match['player2_answer'] = None
-        match['player1_correct'] = None
-        match['player2_correct'] = None
-        
-        # 进入下一题
-        match['current_question_idx'] += 1
-        
-        # 检查游戏是否结束
-        if match['player1_hp'] <= 0 or match['player2_hp'] <= 0 or match['current_question_idx'] >= len(match['questions']):
-            match['game_over'] = True
-            if match['player1_hp'] > match['player2_hp']:
-                match['winner'] = match['player1']
-            elif match['player2_hp'] > match['player1_hp']:
-                match['winner'] = match['player2']
-            else:
-                match['winner'] = 'draw'
-            
-            # 更新玩家统计
-            if match['winner'] == match['player1']:
-                update_player_stats(match['player1'], True)
-                update_player_stats(match['player2'], False)
-            elif match['winner'] == match['player2']:
-                update_player_stats(match['player2'], True)
-                update_player_stats(match['player1'], False)
-    
-    save_json(MATCHES_FILE, matches)
-    
-    response = {'success': True, 'player_answered': True}
-    if round_result:
-        response['round_result'] = round_result
-        logger.info(f"[API] Returning round_result: {round_result}")
-    else:
-        logger.info("[API] Returning player_answered only, waiting for opponent")
-    
-    return jsonify(response)
-
-def update_player_stats(user_id, won):
-    import random
-    players = load_json(PLAYERS_FILE, [])
-    for p in players:
-        if p['user_id'] == user_id:
-            if won:
-                p['wins'] = p.get('wins', 0) + 1
-                p['medals'] = p.get('medals', 0) + 1
-                p['gold'] = p.get('gold', 10) + random.randint(10, 20)
-            break
-    save_json(PLAYERS_FILE, players)
+    return jsonify({'success': True, 'player_answered': True, **result})
 
 @app.route('/api/game/quit', methods=['POST'])
 def quit_game():
     data = request.get_json()
-    match_id = data.get('match_id')
-    user_id = data.get('user_id')
-    
-    matches = load_json(MATCHES_FILE, [])
-    for i, m in enumerate(matches):
-        if m['match_id'] == match_id and not m['game_over']:
-            matches[i]['game_over'] = True
-            matches[i]['winner'] = m['player2'] if m['player1'] == user_id else m['player1']
-            update_player_stats(matches[i]['winner'], True)
-            save_json(MATCHES_FILE, matches)
-            return jsonify({'success': True})
     
+    if game_engine.quit(data.get('match_id'), data.get('user_id')):
+        return jsonify({'success': True})
     return jsonify({'success': False, 'message': '比赛不存在'})
 
 @app.route('/api/game/heartbeat', methods=['POST'])
 def game_heartbeat():
     data = request.get_json()
-    match_id = data.get('match_id')
-    user_id = data.get('user_id')
-    
-    matches = load_json(MATCHES_FILE, [])
-    for i, m in enumerate(matches):
-        if m['match_id'] == match_id and not m['game_over']:
-            if m['player1'] == user_id:
-                matches[i]['player1_last_active'] = datetime.now().isoformat()
-            elif m['player2'] == user_id:
-                matches[i]['player2_last_active'] = datetime.now().isoformat()
-            save_json(MATCHES_FILE, matches)
-            return jsonify({'success': True})
-    
-    return jsonify({'success': False})
+    return jsonify({'success': game_engine.heartbeat(data.get('match_id'), data.get('user_id'))})
 
 @app.route('/api/game/inventory', methods=['POST'])
 def update_inventory():
     data = request.get_json()
-    user_id = data.get('user_id')
-    inventory = data.get('inventory', [])
-    
-    players = load_json(PLAYERS_FILE, [])
-    for p in players:
-        if p['user_id'] == user_id:
-            p['inventory'] = inventory
-            break
-    save_json(PLAYERS_FILE, players)
+    game_engine.set_inventory(data.get('user_id'), data.get('inventory', []))
     return jsonify({'success': True})
 
 @app.route('/api/game/leaderboard', methods=['GET'])
 def get_game_leaderboard():
-    players = load_json(PLAYERS_FILE, [])
-    sorted_players = sorted(players, key=lambda x: x.get('medals', 0), reverse=True)[:20]
-    return jsonify({'leaderboard': sorted_players})
+    return jsonify({'leaderboard': game_engine.leaderboard(20)})
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+LMS-Edge Flask DB Benchmark - 对比每次请求新建连接和连接池的吞吐
+
+在临时目录建两个新库，分别用旧的 get_db（每次 sqlite3.connect，不设 PRAGMA）
+和连接池跑同样的请求：提交作业（写）和带 user_id 的作业列表（读）。
+用 Flask test client 在进程内多线程发请求，不需要启动服务。
+
+    python bench_flask_db.py --requests 2000 --threads 8
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def legacy_get_db(path):
+    def get_db():
+        conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get_db
+
+
+def seed(app_api, students, assignments):
+    app_api.init_db()
+    conn = sqlite3.connect(app_api.DB_PATH, isolation_level=None)
+    conn.execute('BEGIN')
+    conn.executemany('INSERT INTO users (username, password_hash, full_name, role) VALUES (?, ?, ?, ?)',
+                     [(f'bench{i}', 'x', f'Bench {i}', 'student') for i in range(students)])
+    conn.executemany('INSERT INTO assignments (title, content, assignment_type, created_by) VALUES (?, ?, ?, ?)',
+                     [(f'Essay {i}', 'bench', 'essay', 1) for i in range(assignments)])
+    conn.execute('COMMIT')
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench%'")]
+    assignment_ids = [row[0] for row in conn.execute('SELECT id FROM assignments')]
+    conn.close()
+    return user_ids, assignment_ids
+
+
+def run(app_api, total, threads, user_ids, assignment_ids):
+    def worker(offset):
+        client = app_api.app.test_client()
+        latencies = []
+        for i in range(offset, total, threads):
+            user_id = user_ids[i % len(user_ids)]
+            started = time.perf_counter()
+            if i % 2:
+                response = client.get(f'/api/assignments?user_id={user_id}')
+            else:
+                response = client.post('/api/assignments/submit', json={
+                    'user_id': user_id,
+                    'assignment_id': assignment_ids[i % len(assignment_ids)],
+                    'answer': f'answer {i}',
+                })
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(l for part in pool.map(worker, range(threads)) for l in part)
+    elapsed = time.perf_counter() - started
+    p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+    return total / elapsed, latencies[len(latencies) // 2] * 1000, p99 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Flask API per-request connections vs the SQLite pool')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--students', type=int, default=60)
+    parser.add_argument('--assignments', type=int, default=30)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lms-bench-')
+    os.environ['DB_PATH'] = os.path.join(workdir, 'pooled.db')
+    for name in ('STATIC_DIR', 'UPLOAD_DIR', 'ATTACHMENTS_DIR', 'SUBMISSIONS_DIR'):
+        os.environ[name] = os.path.join(workdir, name.lower())
+    os.environ.setdefault('PASSWORD_PBKDF2_ITERATIONS', '1000')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import logging
+    import app_api
+    logging.getLogger().setLevel(logging.WARNING)
+
+    pooled_path, pooled_get_db = app_api.DB_PATH, app_api.get_db
+    legacy_path = os.path.join(workdir, 'legacy.db')
+
+    results = []
+    for label, path, get_db in (('per-request connect', legacy_path, legacy_get_db(legacy_path)),
+                                ('pooled', pooled_path, pooled_get_db)):
+        app_api.DB_PATH = path
+        app_api.get_db = get_db
+        user_ids, assignment_ids = seed(app_api, args.students, args.assignments)
+        results.append((label, *run(app_api, args.requests, args.threads, user_ids, assignment_ids)))
+
+    print(f"{args.requests} requests, {args.threads} threads (submit + list assignments), db in {workdir}")
+    for label, rps, p50, p99 in results:
+        print(f"  {label:<20} {rps:8.0f} req/s  p50={p50:7.2f} ms  p99={p99:7.2f} ms")
+    print(f"  pool connections opened: {app_api.db_pool.created}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,8 +12,11 @@ import os
 import hashlib
 import time
 import sys
+import atexit
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
+from app.core.simple_security import hash_password, verify_password
+from app.services.audit_log import AuditLog
 
 def parse_args():
     port = 8080
@@ -132,10 +135,12 @@ def parse_json(body):
     except:
         return {}
 
-def log_operation(cursor, user_id, username, action, target, details):
-    cursor.execute('''INSERT INTO operation_logs (user_id, username, action, target, details) 
-                     VALUES (?, ?, ?, ?, ?)''',
-                     (user_id, username, action, target, details))
+# 操作日志只入队，后台线程批量写入，不再占用请求里的事务
+audit_log = AuditLog(get_db)
+atexit.register(audit_log.close)
+
+def log_operation(user_id, username, action, target, details):
+    audit_log.record(user_id, username, action, target, details)
 
 class LMSHandler(http.server.BaseHTTPRequestHandler):
     def log_message(self, format, *args):
@@ -232,7 +237,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             path = urlparse(self.path).path
-            params = parse_qs(urlparse(path).query)
+            params = parse_qs(urlparse(self.path).query)
             
             if path == '/' or path == '/index.html':
                 self.serve_index()
@@ -264,7 +269,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
                 assignment_id = params.get('assignment_id', [0])[0]
                 self.handle_submissions_by_assignment(int(assignment_id))
             elif path == '/api/logs':
-                self.get_logs({})
+                self.get_logs({key: values[0] for key, values in params.items()})
             else:
                 self.serve_static(path)
         except Exception as e:
@@ -301,16 +306,11 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         user = conn.execute('SELECT * FROM users WHERE username = ? AND deleted = 0', (data.get('username',''),)).fetchone()
         
         if user:
-            pwd_hash = hashlib.sha256(data.get('password','').encode()).hexdigest()
-            if user['password_hash'] == pwd_hash:
+            if verify_password(data.get('password',''), user['password_hash']):
                 user_dict = dict(user)
                 conn.close()
                 
-                conn = get_db()
-                cursor = conn.cursor()
-                log_operation(cursor, user['id'], user['username'], 'LOGIN', 'auth', '用户登录成功')
-                conn.commit()
-                conn.close()
+                log_operation(user['id'], user['username'], 'LOGIN', 'auth', '用户登录成功')
                 
                 self.send_json({
                     'token': f'token_{user["id"]}_{int(time.time())}',
@@ -360,12 +360,12 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         conn = get_db()
         cursor = conn.cursor()
         try:
-            pwd_hash = hashlib.sha256(data.get('password').encode()).hexdigest()
+            pwd_hash = hash_password(data.get('password'))
             cursor.execute('''INSERT INTO users (username, password_hash, full_name, role) 
                              VALUES (?, ?, ?, ?)''',
                              (data.get('username'), pwd_hash, data.get('full_name'), data.get('role', 'student')))
             user_id = cursor.lastrowid
-            log_operation(cursor, data.get('created_by', 1), 'CREATE', 'user', f'创建用户: {data.get("username")} (角色: {data.get("role")})')
+            log_operation(data.get('created_by', 1), None, 'CREATE', 'user', f'创建用户: {data.get("username")} (角色: {data.get("role")})')
             conn.commit()
             conn.close()
             self.send_json({'success': True, 'id': user_id})
@@ -387,12 +387,12 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
             values.append(data.get('role'))
         if data.get('password'):
             updates.append('password_hash = ?')
-            values.append(hashlib.sha256(data.get('password').encode()).hexdigest())
+            values.append(hash_password(data.get('password')))
         
         if updates:
             values.append(data.get('id'))
             cursor.execute(f'UPDATE users SET {", ".join(updates)} WHERE id = ? AND deleted = 0', values)
-            log_operation(cursor, data.get('id'), 'UPDATE', 'user', f'更新用户ID: {data.get("id")}')
+            log_operation(data.get('id'), None, 'UPDATE', 'user', f'更新用户ID: {data.get("id")}')
             conn.commit()
         
         conn.close()
@@ -411,10 +411,10 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         cursor = conn.cursor()
         user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
         
-        if user and user['password_hash'] == hashlib.sha256(old_password.encode()).hexdigest():
+        if user and verify_password(old_password, user['password_hash']):
             cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', 
-                          (hashlib.sha256(new_password.encode()).hexdigest(), user_id))
-            log_operation(cursor, user_id, user['username'], 'PASSWORD', 'user', '修改密码')
+                          (hash_password(new_password), user_id))
+            log_operation(user_id, user['username'], 'PASSWORD', 'user', '修改密码')
             conn.commit()
             self.send_json({'success': True})
         else:
@@ -430,7 +430,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET deleted = 1 WHERE id = ?', (user_id,))
-        log_operation(cursor, user_id, 'DELETE', 'user', f'删除用户ID: {user_id}')
+        log_operation(user_id, None, 'DELETE', 'user', f'删除用户ID: {user_id}')
         conn.commit()
         conn.close()
         self.send_json({'success': True})
@@ -492,7 +492,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
                               json.dumps(data.get('options', [])), data.get('correct_answer'),
                               data.get('points', 10), data.get('created_by')))
             assignment_id = cursor.lastrowid
-            log_operation(cursor, data.get('created_by'), 'CREATE', 'assignment', f'创建作业: {data.get("title")}')
+            log_operation(data.get('created_by'), None, 'CREATE', 'assignment', f'创建作业: {data.get("title")}')
             conn.commit()
             conn.close()
             self.send_json({'success': True, 'id': assignment_id})
@@ -505,7 +505,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         cursor = conn.cursor()
         cursor.execute('UPDATE assignments SET deleted = 1 WHERE id = ?', (assignment_id,))
         cursor.execute('UPDATE submissions SET deleted = 1 WHERE assignment_id = ?', (assignment_id,))
-        log_operation(cursor, 1, 'DELETE', 'assignment', f'删除作业ID: {assignment_id}')
+        log_operation(1, None, 'DELETE', 'assignment', f'删除作业ID: {assignment_id}')
         conn.commit()
         conn.close()
         self.send_json({'success': True})
@@ -544,7 +544,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         if updates:
             values.append(assignment_id)
             cursor.execute(f'UPDATE assignments SET {", ".join(updates)} WHERE id = ? AND deleted = 0', values)
-            log_operation(cursor, assignment['created_by'], 'UPDATE', 'assignment', f'更新作业: {data.get("title", assignment["title"])}')
+            log_operation(assignment['created_by'], None, 'UPDATE', 'assignment', f'更新作业: {data.get("title", assignment["title"])}')
             conn.commit()
         
         conn.close()
@@ -582,12 +582,12 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
             cursor.execute('''UPDATE submissions SET student_answer = ?, score = ?, is_correct = ?, submitted_at = ?
                           WHERE id = ?''',
                           (answer, score, is_correct, datetime.now().isoformat(), existing['id']))
-            log_operation(cursor, user_id, 'UPDATE', 'submission', f'更新作答: 作业{assignment_id}')
+            log_operation(user_id, None, 'UPDATE', 'submission', f'更新作答: 作业{assignment_id}')
         else:
             cursor.execute('''INSERT INTO submissions (user_id, assignment_id, student_answer, score, is_correct)
                            VALUES (?, ?, ?, ?, ?)''',
                            (user_id, assignment_id, answer, score, is_correct))
-            log_operation(cursor, user_id, 'CREATE', 'submission', f'提交作业: 作业{assignment_id}')
+            log_operation(user_id, None, 'CREATE', 'submission', f'提交作业: 作业{assignment_id}')
         
         conn.commit()
         conn.close()
@@ -599,7 +599,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         submission = conn.execute('SELECT * FROM submissions WHERE id = ?', (submission_id,)).fetchone()
         if submission:
             cursor.execute('UPDATE submissions SET deleted = 1 WHERE id = ?', (submission_id,))
-            log_operation(cursor, submission['user_id'], 'DELETE', 'submission', f'删除作答ID: {submission_id}')
+            log_operation(submission['user_id'], None, 'DELETE', 'submission', f'删除作答ID: {submission_id}')
             conn.commit()
         conn.close()
         self.send_json({'success': True})
@@ -635,7 +635,7 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         cursor.execute('INSERT INTO attendances (user_id, activity_score) VALUES (?, ?)', (user_id, 100))
         
         user = cursor.execute('SELECT username, full_name FROM users WHERE id = ?', (user_id,)).fetchone()
-        log_operation(cursor, user_id, user['username'] if user else 'unknown', 'ATTENDANCE', 'attendance', f'自动签到: {user["full_name"] if user else "未知用户"}')
+        log_operation(user_id, user['username'] if user else 'unknown', 'ATTENDANCE', 'attendance', f'自动签到: {user["full_name"] if user else "未知用户"}')
         
         conn.commit()
         conn.close()
@@ -694,11 +694,22 @@ class LMSHandler(http.server.BaseHTTPRequestHandler):
         })
     
     def get_logs(self, data):
+        # 按 id 倒序的游标分页，before_id 取上一页的 next_before_id
+        limit = min(max(int(data.get('limit') or 200), 1), 500)
+        before_id = data.get('before_id')
         conn = get_db()
-        limit = 200
-        logs = conn.execute('''SELECT * FROM operation_logs ORDER BY created_at DESC LIMIT ?''', (limit,)).fetchall()
+        if before_id in (None, ''):
+            audit_log.flush()
+            logs = conn.execute('SELECT * FROM operation_logs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        else:
+            logs = conn.execute('SELECT * FROM operation_logs WHERE id < ? ORDER BY id DESC LIMIT ?',
+                                (int(before_id), limit)).fetchall()
         conn.close()
-        self.send_json({'logs': [dict(l) for l in logs]})
+        self.send_json({
+            'logs': [dict(l) for l in logs],
+            'next_before_id': logs[-1]['id'] if len(logs) == limit else None,
+            'dropped': audit_log.dropped
+        })
 
 print(f"\n{'='*50}")
 print(f"  LMS-Edge Server v3.0 Started!")
@@ -714,4 +725,5 @@ with socketserver.TCPServer(("", PORT), LMSHandler) as httpd:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nStopping server...")
+        audit_log.close()
         conn.close()
@@ -1,87 +1,36 @@
 #!/usr/bin/env python3
-"""Initialize game database with default users"""
-import sqlite3
-import os
+"""
+LMS-Edge 对战数据迁移 - 建 game_* 表并导入旧的 data/game/*.json
 
-DB_PATH = '/home/raven/lms-edge/backend/data/lms.db'
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+表结构在 app/services/game_store.py，和 app_api.py 使用的是同一份。
+可重复执行：已存在的玩家和比赛不会被覆盖。导入后 JSON 文件改名为
+*.imported（--keep 保留原文件）。app_api.py 启动时发现旧文件也会自动导入。
 
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
+用法: python init_game_db.py [--db data/lms.db] [--game-dir data/game] [--keep]
+"""
 
-# Create users table (matching app_api.py schema)
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
-    full_name TEXT,
-    role TEXT DEFAULT 'student',
-    avatar TEXT
-)
-''')
+import argparse
+import os
+import sqlite3
 
-# Create assignments table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS assignments (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    title TEXT NOT NULL,
-    content TEXT,
-    assignment_type TEXT DEFAULT 'normal',
-    options TEXT,
-    correct_answer TEXT,
-    points INTEGER DEFAULT 10,
-    attachment TEXT,
-    created_by INTEGER,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
+from app.services.game_store import SQLiteGameStore
 
-# Create submissions table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS submissions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    assignment_id INTEGER,
-    student_answer TEXT,
-    score INTEGER,
-    is_correct INTEGER,
-    submitted_at TIMESTAMP,
-    attachment TEXT
-)
-''')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create attendance table
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS attendance (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    date DATE,
-    status TEXT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-''')
 
-# Insert default users if they don't exist
-users = [
-    (1, 'admin', 'admin123', '系统管理员', 'admin', None),
-    (2, 'teacher', 'teacher123', '教师', 'teacher', None),
-    (3, 'student', 'student123', '学生', 'student', None),
-    (8, 'U1', '123456', '王五', 'student', None),
-    (9, 'U2', '123456', '马六', 'student', None),
-]
+def main():
+    parser = argparse.ArgumentParser(description='Create game tables and import legacy game JSON files')
+    parser.add_argument('--db', default=os.environ.get('DB_PATH', os.path.join(BASE_DIR, 'data', 'lms.db')))
+    parser.add_argument('--game-dir', default=os.environ.get('GAME_DIR', os.path.join(BASE_DIR, 'data', 'game')))
+    parser.add_argument('--keep', action='store_true', help='keep the JSON files instead of renaming them')
+    args = parser.parse_args()
 
-for user in users:
-    try:
-        cursor.execute('INSERT OR IGNORE INTO users (id, username, password, full_name, role, avatar) VALUES (?, ?, ?, ?, ?, ?)', user)
-    except:
-        pass
+    os.makedirs(os.path.dirname(args.db), exist_ok=True)
+    store = SQLiteGameStore(lambda: sqlite3.connect(args.db, isolation_level=None, timeout=30))
+    players, matches = store.import_json(args.game_dir, rename=not args.keep)
+    print(f'Database: {args.db}')
+    print(f'Imported {players} players and {matches} matches from {args.game_dir}')
 
-conn.commit()
-print('Database initialized!')
-print('Users created:')
-cursor.execute('SELECT id, username, full_name, role FROM users')
-for row in cursor.fetchall():
-    print(f'  ID:{row[0]} {row[1]} ({row[2]}) - {row[3]}')
 
-conn.close()
+if __name__ == '__main__':
+    main()
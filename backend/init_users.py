@@ -1,7 +1,7 @@
 import asyncio
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.database import AsyncSessionLocal
+from app.core.database import AsyncSessionLocal, dispose_engines
 from app.core.security import get_password_hash
 from app.models.user import User, UserRole
 
@@ -76,5 +76,12 @@ async def create_default_users():
             raise
 
 
+async def main():
+    try:
+        await create_default_users()
+    finally:
+        await dispose_engines()
+
+
 if __name__ == "__main__":
-    asyncio.run(create_default_users())
+    asyncio.run(main())
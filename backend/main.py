@@ -3,9 +3,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import create_tables, dispose_engines
+from app.core.password_pool import password_pool
+from app.services.board_log import board_log
 from app.api import auth, users, assignments, attendance, board, stats, system
-from app.websocket import manager
+from app.websocket import router as websocket_router
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -15,9 +17,12 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting LMS-Edge application...")
-    init_db()
+    await create_tables()
     yield
     logger.info("Shutting down LMS-Edge application...")
+    await board_log.flush_all()
+    await dispose_engines()
+    password_pool.shutdown()
 
 
 app = FastAPI(
@@ -45,7 +50,7 @@ app.include_router(attendance.router, prefix="/api/attendance", tags=["考勤"])
 app.include_router(board.router, prefix="/api/board", tags=["白板"])
 app.include_router(stats.router, prefix="/api/stats", tags=["统计"])
 app.include_router(system.router, prefix="/api/system", tags=["系统"])
-app.include_router(manager.router)
+app.include_router(websocket_router)
 
 
 @app.get("/")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+LMS-Edge 索引迁移 - 在已有的 lms.db 上补建复合索引
+
+可重复执行：已存在的索引会跳过，缺少对应列的索引（Flask 与 FastAPI
+两套表结构不同）也会跳过。执行前后分别打印热点查询的 EXPLAIN QUERY PLAN。
+新增的可空列（如 board_logs.seq）在建索引前用 ALTER TABLE 补上。
+
+用法: python migrate_indexes.py [--db data/lms.db] [--dry-run]
+"""
+
+import argparse
+import os
+import sqlite3
+
+COLUMNS = [
+    ('board_logs', 'seq', 'INTEGER'),
+]
+
+INDEXES = [
+    ('ix_submissions_assignment_correct', 'submissions', ('assignment_id', 'is_correct', 'score')),
+    ('ix_submissions_user_correct', 'submissions', ('user_id', 'is_correct')),
+    ('ix_submissions_user_assignment', 'submissions', ('user_id', 'assignment_id')),
+    ('ix_attendances_user_login', 'attendances', ('user_id', 'login_time')),
+    ('ix_attendances_user_late', 'attendances', ('user_id', 'is_late')),
+    ('ix_board_messages_board_created', 'board_messages', ('board_id', 'created_at')),
+    ('ix_board_logs_board_seq', 'board_logs', ('board_id', 'seq')),
+]
+
+HOT_QUERIES = [
+    ('submissions', ('assignment_id', 'is_correct', 'score'),
+     'SELECT COUNT(*), SUM(is_correct = 1), AVG(score) FROM submissions WHERE assignment_id = 1'),
+    ('submissions', ('user_id', 'is_correct'),
+     'SELECT COUNT(*) FROM submissions WHERE user_id = 1 AND is_correct = 1'),
+    ('submissions', ('user_id', 'assignment_id'),
+     'SELECT id FROM submissions WHERE user_id = 1 AND assignment_id = 1'),
+    ('attendances', ('user_id', 'login_time'),
+     'SELECT * FROM attendances WHERE user_id = 1 ORDER BY login_time DESC LIMIT 1'),
+    ('attendances', ('user_id', 'is_late'),
+     'SELECT COUNT(*) FROM attendances WHERE user_id = 1 AND is_late = 1'),
+    ('board_messages', ('board_id', 'created_at'),
+     "SELECT * FROM board_messages WHERE board_id = 'main' ORDER BY created_at DESC LIMIT 50"),
+]
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def applicable(conn, table, columns):
+    existing = table_columns(conn, table)
+    return bool(existing) and all(c in existing for c in columns)
+
+
+def existing_indexes(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def report_plans(conn, title):
+    print(f'\n--- {title} ---')
+    for table, columns, sql in HOT_QUERIES:
+        if not applicable(conn, table, columns):
+            continue
+        print(sql)
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}'):
+            print(f'    {row[-1]}')
+
+
+def migrate(db_path, dry_run=False):
+    if not os.path.exists(db_path):
+        print(f'Database not found: {db_path}')
+        return 1
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        report_plans(conn, 'Query plans before')
+
+        print('\n--- Columns ---')
+        for table, column, column_type in COLUMNS:
+            existing = table_columns(conn, table)
+            if not existing or column in existing:
+                continue
+            sql = f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'
+            if dry_run:
+                print(f'  ? {sql}')
+                continue
+            conn.execute(sql)
+            print(f'  + {table}.{column}')
+
+        present = existing_indexes(conn)
+        created = []
+        print('\n--- Indexes ---')
+        for name, table, columns in INDEXES:
+            if name in present:
+                print(f'  = {name} (exists)')
+                continue
+            if not applicable(conn, table, columns):
+                print(f'  - {name} (skipped, {table} has no {", ".join(columns)})')
+                continue
+            sql = f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'
+            if dry_run:
+                print(f'  ? {sql}')
+                continue
+            conn.execute(sql)
+            created.append(name)
+            print(f'  + {name}')
+
+        if created:
+            conn.execute('ANALYZE')
+            report_plans(conn, 'Query plans after')
+        print(f'\nCreated {len(created)} index(es).')
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create missing composite indexes on lms.db')
+    parser.add_argument('--db', default=os.environ.get('DB_PATH', 'data/lms.db'))
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    raise SystemExit(migrate(args.db, args.dry_run))
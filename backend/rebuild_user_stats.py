@@ -0,0 +1,26 @@
+import asyncio
+from app.core.database import AsyncSessionLocal, init_db, dispose_engines
+from app.services.user_stats import rebuild_user_stats
+
+
+async def rebuild():
+    async with AsyncSessionLocal() as session:
+        try:
+            count = await rebuild_user_stats(session)
+            print(f"✓ Rebuilt user_stats for {count} users")
+        except Exception as e:
+            await session.rollback()
+            print(f"Error rebuilding user_stats: {e}")
+            raise
+
+
+async def main():
+    try:
+        await rebuild()
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    init_db()
+    asyncio.run(main())
@@ -2,12 +2,40 @@ import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import { io } from 'socket.io-client'
 
+// 每种路径命令携带的坐标个数，与后端 draw_batcher.COMMAND_ARITY 一致
+const COMMAND_ARITY = { M: 2, L: 2, T: 2, Q: 4, S: 4, C: 6, Z: 0 }
+
+function decodePoints(encoded) {
+  const last = [0, 0]
+  const coords = encoded.d.map((delta, i) => {
+    last[i % 2] += delta
+    return last[i % 2]
+  })
+  if (!encoded.c) {
+    const points = []
+    for (let i = 0; i < coords.length; i += 2) {
+      points.push([coords[i], coords[i + 1]])
+    }
+    return points
+  }
+  let offset = 0
+  return [...encoded.c].map(command => {
+    const arity = COMMAND_ARITY[command]
+    const point = [command, ...coords.slice(offset, offset + arity)]
+    offset += arity
+    return point
+  })
+}
+
 export const useWebSocketStore = defineStore('websocket', () => {
   const socket = ref(null)
   const connected = ref(false)
   const onlineUsers = ref([])
+  const presenceVersion = ref(0)
   const boardData = ref([])
   const boardMessages = ref([])
+  // 已经收到的白板事件序号，重连时带给服务端只补发之后的事件
+  const boardSeq = ref(0)
   
   const onlineStudentCount = computed(() => {
     return onlineUsers.value.filter(u => u.role === 'student').length
@@ -23,6 +51,12 @@ export const useWebSocketStore = defineStore('websocket', () => {
       transports: ['websocket']
     })
     
+    socket.value.io.on('reconnect_attempt', () => {
+      if (boardId && boardSeq.value) {
+        socket.value.io.opts.query.since = boardSeq.value
+      }
+    })
+    
     socket.value.on('connect', () => {
       connected.value = true
       console.log('WebSocket connected')
@@ -35,17 +69,59 @@ export const useWebSocketStore = defineStore('websocket', () => {
     
     socket.value.on('online_users', (data) => {
       onlineUsers.value = data.data
+      presenceVersion.value = data.version || 0
+    })
+    
+    socket.value.on('presence_delta', (data) => {
+      const delta = data.data
+      if (delta.base !== presenceVersion.value) {
+        // 漏掉了增量，重新拉取完整快照
+        socket.value.emit('message', {
+          type: 'presence_sync',
+          data: { version: presenceVersion.value }
+        })
+        return
+      }
+      const left = new Set(delta.left)
+      const joined = new Map(delta.joined.map(u => [u.user_id, u]))
+      onlineUsers.value = onlineUsers.value
+        .filter(u => !left.has(u.user_id) && !joined.has(u.user_id))
+        .concat([...joined.values()])
+      presenceVersion.value = delta.version
     })
     
     socket.value.on('draw', (data) => {
-      boardData.value.push(data.data)
+      applyBoardEvent(data.data.seq, data.data)
+    })
+    
+    socket.value.on('board_state', (data) => {
+      const state = data.data
+      if (state.reset) {
+        boardData.value = [...state.strokes]
+        boardSeq.value = 0
+      }
+      for (const event of state.events) {
+        applyBoardEvent(event.seq, event.action_type === 'clear' ? { action: 'clear' } : event.content)
+      }
+      boardSeq.value = Math.max(boardSeq.value, state.seq)
+    })
+    
+    socket.value.on('draw_batch', (data) => {
+      for (const event of data.data.events) {
+        if (event.encoding === 'delta') {
+          event.points = decodePoints(event.points)
+        }
+        applyBoardEvent(event.seq, event)
+      }
     })
     
     socket.value.on('message', (data) => {
       boardMessages.value.push(data.data)
     })
     
-    socket.value.on('clear', () => {
+    socket.value.on('clear', (data) => {
+      if (data?.seq && data.seq <= boardSeq.value) return
+      boardSeq.value = data?.seq || boardSeq.value
       boardData.value = []
     })
     
@@ -65,14 +141,25 @@ export const useWebSocketStore = defineStore('websocket', () => {
     })
   }
   
+  // 重连后补发的事件可能和实时广播重复，按序号丢弃已经处理过的
+  function applyBoardEvent(seq, event) {
+    if (seq) {
+      if (seq <= boardSeq.value) return
+      boardSeq.value = seq
+    }
+    boardData.value.push(event)
+  }
+  
   function disconnect() {
     if (socket.value) {
       socket.value.disconnect()
       socket.value = null
       connected.value = false
       onlineUsers.value = []
+      presenceVersion.value = 0
       boardData.value = []
       boardMessages.value = []
+      boardSeq.value = 0
     }
   }
   